@@ -0,0 +1,84 @@
+"""Declarative achievement rules.
+
+Each rule has a fixed bit in ``UserStats.achievement_mask`` and declares the
+stats fields it depends on, so an event only evaluates the rules its changed
+fields can affect, against the unlocked set cached on the stats row. Bits are
+persisted: append new rules with new bits, never renumber existing ones.
+"""
+from app import db
+from models import Achievement
+from sqlalchemy import insert
+from datetime import datetime
+
+STATS_FIELDS = ('total_habits_completed', 'total_points', 'level', 'longest_streak')
+
+
+class AchievementRule:
+    def __init__(self, bit, name, description, icon, color, depends_on, check, points=10):
+        self.bit = bit
+        self.mask = 1 << bit
+        self.name = name
+        self.description = description  # formatted with the user's stats as ``stats``
+        self.icon = icon
+        self.color = color
+        self.depends_on = frozenset(depends_on)
+        self.check = check
+        self.points = points
+
+    def __repr__(self):
+        return f"AchievementRule({self.bit}, '{self.name}')"
+
+
+RULES = [
+    AchievementRule(0, 'First Steps', 'Completed your first habit!', 'fas fa-baby', '#10b981',
+                    ['total_habits_completed'], lambda stats: stats.total_habits_completed >= 1),
+    AchievementRule(1, 'Week Warrior', 'Completed habits for 7 days!', 'fas fa-calendar-week', '#6366f1',
+                    ['total_habits_completed'], lambda stats: stats.total_habits_completed >= 7),
+    AchievementRule(2, 'Month Master', 'Completed habits for 30 days!', 'fas fa-calendar-alt', '#8b5cf6',
+                    ['total_habits_completed'], lambda stats: stats.total_habits_completed >= 30),
+    AchievementRule(3, 'Streak Master', 'Maintained a {stats.longest_streak}-day streak!', 'fas fa-fire', '#f59e0b',
+                    ['longest_streak'], lambda stats: stats.longest_streak >= 10),
+    AchievementRule(4, 'Rising Star', 'Reached level {stats.level}!', 'fas fa-star', '#ec4899',
+                    ['level'], lambda stats: stats.level >= 5),
+    AchievementRule(5, 'Habit Hero', 'Reached level {stats.level}!', 'fas fa-crown', '#f59e0b',
+                    ['level'], lambda stats: stats.level >= 10),
+]
+
+# Rules to evaluate for each stats field
+RULES_BY_FIELD = {field: [rule for rule in RULES if field in rule.depends_on] for field in STATS_FIELDS}
+
+
+def check_achievements(user_id, user_stats, changed_fields=None):
+    """Unlock the achievements newly earned by ``user_stats``.
+
+    Only rules depending on ``changed_fields`` (all rules when ``None``) that
+    are not already in the stats' unlocked mask are evaluated. New unlocks are
+    written with one bulk insert and recorded in the mask; no query is issued
+    when nothing unlocks. Returns the names of the unlocked achievements.
+    """
+    if changed_fields is None:
+        candidates = RULES
+    else:
+        candidates = {rule for field in changed_fields for rule in RULES_BY_FIELD.get(field, ())}
+
+    unlocked = user_stats.achievement_mask or 0
+    earned = [rule for rule in candidates if not unlocked & rule.mask and rule.check(user_stats)]
+    if not earned:
+        return []
+
+    earned.sort(key=lambda rule: rule.bit)
+    now = datetime.utcnow()
+    db.session.execute(insert(Achievement), [{
+        'user_id': user_id,
+        'name': rule.name,
+        'description': rule.description.format(stats=user_stats),
+        'icon': rule.icon,
+        'color': rule.color,
+        'points': rule.points,
+        'unlocked_at': now,
+    } for rule in earned])
+
+    for rule in earned:
+        unlocked |= rule.mask
+    user_stats.achievement_mask = unlocked
+    return [rule.name for rule in earned]
@@ -0,0 +1,145 @@
+"""Columnar analytics over a user's habit-by-day completion matrix.
+
+``load_matrix`` reads all of a user's completed HabitLog rows in one query into
+a dense NumPy matrix (one row per habit, one column per day). Every statistic
+below is computed for all habits at once on that matrix. Matrices are cached
+per user; writes call ``invalidate()``, and entries also expire after
+``CACHE_TTL`` seconds so other worker processes never serve stale data for long.
+"""
+from app import db
+from models import Habit, HabitLog
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+
+CACHE_TTL = 300
+CACHE_SIZE = 256
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Smallest gap between a habit's best and worst weekday rates worth pointing out
+WEEKDAY_GAP = 0.15
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class HabitMatrix:
+    """Completion matrix for one user's habits.
+
+    ``completed[i, j]`` is 1 when habit ``i`` was completed on ``start + j``
+    days; ``tracked[i, j]`` is True from the day habit ``i`` started being
+    tracked, so rates never count days before a habit existed.
+    """
+
+    def __init__(self, habits, completed, tracked, start):
+        import numpy as np
+        self.habit_ids = [habit.id for habit in habits]
+        self.names = [habit.name for habit in habits]
+        self.completed = completed
+        self.tracked = tracked
+        self.start = start
+        self.dates = np.arange(np.datetime64(start, 'D'), np.datetime64(start, 'D') + completed.shape[1])
+
+    @property
+    def empty(self):
+        return not self.habit_ids
+
+    def rates(self, days):
+        """Completion rate (0-1) of each habit over its tracked days among the last ``days``"""
+        import numpy as np
+        completed = self.completed[:, -days:].sum(axis=1)
+        tracked = self.tracked[:, -days:].sum(axis=1)
+        return np.divide(completed, tracked, out=np.zeros(len(self.habit_ids)), where=tracked > 0)
+
+    def weekday_rates(self):
+        """Completion rate of each habit per weekday, shape ``(habits, 7)``, Monday first.
+
+        Weekdays a habit was never tracked on are NaN.
+        """
+        import numpy as np
+        weekdays = (self.dates.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        onehot = np.eye(7, dtype=np.int64)[weekdays]
+        completed = self.completed.astype(np.int64) @ onehot
+        tracked = self.tracked.astype(np.int64) @ onehot
+        return np.divide(completed, tracked, out=np.full(completed.shape, np.nan), where=tracked > 0)
+
+    def weak_and_strong_weekday(self, index, gap=WEEKDAY_GAP):
+        """``(weakest, strongest)`` weekday names of habit ``index``, or ``None``
+        when its tracked weekdays differ by less than ``gap``"""
+        import numpy as np
+        rates = self.weekday_rates()[index]
+        if np.isnan(rates).all() or np.nanmax(rates) - np.nanmin(rates) < gap:
+            return None
+        return WEEKDAYS[int(np.nanargmin(rates))], WEEKDAYS[int(np.nanargmax(rates))]
+
+    def period_change(self, days=14):
+        """Change in completion rate between the last ``days`` and the ``days`` before"""
+        import numpy as np
+        recent, previous = self.completed[:, -days:], self.completed[:, -2 * days:-days]
+        recent_tracked, previous_tracked = self.tracked[:, -days:].sum(axis=1), self.tracked[:, -2 * days:-days].sum(axis=1)
+        recent_rate = np.divide(recent.sum(axis=1), recent_tracked, out=np.zeros(len(self.habit_ids)), where=recent_tracked > 0)
+        previous_rate = np.divide(previous.sum(axis=1), previous_tracked, out=np.zeros(len(self.habit_ids)), where=previous_tracked > 0)
+        change = recent_rate - previous_rate
+        change[(recent_tracked == 0) | (previous_tracked == 0)] = 0
+        return change
+
+    def current_streaks(self):
+        """Run of completed days ending at each habit's last completed day"""
+        import numpy as np
+        days = self.completed.shape[1]
+        reversed_days = self.completed[:, ::-1]
+        has_any = reversed_days.any(axis=1)
+        last_one = reversed_days.argmax(axis=1)
+        gaps = (reversed_days == 0) & (np.arange(days) >= last_one[:, None])
+        first_gap = np.where(gaps.any(axis=1), gaps.argmax(axis=1), days)
+        return np.where(has_any, first_gap - last_one, 0)
+
+    def best_and_worst(self, days=30):
+        """Indices of the habits with the highest and lowest recent completion rate"""
+        rates = self.rates(days)
+        return int(rates.argmax()), int(rates.argmin())
+
+
+def load_matrix(user_id, today=None):
+    """Return the user's HabitMatrix, building it with one HabitLog query on a cache miss"""
+    import numpy as np
+    today = today or datetime.utcnow().date()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry and entry[0] == today and time.monotonic() - entry[1] < CACHE_TTL:
+            _cache.move_to_end(user_id)
+            return entry[2]
+
+    habits = Habit.query.filter_by(user_id=user_id).order_by(Habit.id).all()
+    rows = db.session.query(HabitLog.habit_id, HabitLog.date).join(Habit).filter(
+        Habit.user_id == user_id,
+        HabitLog.completed == True,
+        HabitLog.date <= today
+    ).all()
+
+    tracked_since = [habit.tracked_since for habit in habits]
+    start = min(tracked_since + [row.date for row in rows] + [today])
+    days = (today - start).days + 1
+
+    completed = np.zeros((len(habits), days), dtype=np.uint8)
+    if rows:
+        index = {habit.id: i for i, habit in enumerate(habits)}
+        habit_rows = np.fromiter((index[row.habit_id] for row in rows), dtype=np.int64, count=len(rows))
+        day_columns = np.fromiter(((row.date - start).days for row in rows), dtype=np.int64, count=len(rows))
+        completed[habit_rows, day_columns] = 1
+    first_tracked = np.array([(min(since, today) - start).days for since in tracked_since], dtype=np.int64)
+    tracked = np.arange(days) >= first_tracked[:, None]
+
+    matrix = HabitMatrix(habits, completed, tracked, start)
+    with _cache_lock:
+        _cache[user_id] = (today, time.monotonic(), matrix)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return matrix
+
+
+def invalidate(user_id):
+    """Drop the cached matrix of ``user_id`` after a write"""
+    with _cache_lock:
+        _cache.pop(user_id, None)
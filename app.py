@@ -1,40 +1,98 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField
-from wtforms.validators import DataRequired, Email, Length, EqualTo
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from flask_login import LoginManager
 import os
-import json
-import random
 from flask_migrate import Migrate
 from flask_cors import CORS
+import sqlite_tuning
+import db_pool
+from replica import RoutingSession, register_replica
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-habit-ally-secret-key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///habits.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_BINDS'] = {'jobs': os.environ.get('JOB_QUEUE_URL', 'sqlite:///jobs.db')}
+
+# Pragmas applied to every SQLite connection (WAL, busy timeout, ...), see sqlite_tuning.py
+app.config['SQLITE_PRAGMAS'] = sqlite_tuning.pragmas_from_env()
+
+# Connection pool sized from the gunicorn worker/thread counts (server databases only), see db_pool.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Optional read replica for read-only views, see replica.py
+if os.environ.get('DATABASE_REPLICA_URL'):
+    replica_url = os.environ['DATABASE_REPLICA_URL']
+    app.config['SQLALCHEMY_BINDS']['replica'] = {'url': replica_url, **db_pool.engine_options(replica_url)}
+# Seconds a user reads from the primary after writing
+app.config['REPLICA_PIN_SECONDS'] = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# Bearer token for scraping /metrics; without one only ADMIN_EMAILS users can read it
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+# Per-request SQL instrumentation: N+1 threshold and optional JSON log line per request
+app.config['SQL_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+app.config['SQL_REQUEST_LOG'] = os.environ.get('SQL_REQUEST_LOG', 'False').lower() == 'true'
+
+# Admins can read /metrics and profile requests with ?profile=1 or X-Profile: 1 (see profiling.py)
+app.config['ADMIN_EMAILS'] = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+# Fraction of requests profiled at random, optionally only these endpoints and user ids
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_ENDPOINTS'] = {name.strip() for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if name.strip()}
+app.config['PROFILE_USER_IDS'] = {int(user_id) for user_id in os.environ.get('PROFILE_USER_IDS', '').split(',') if user_id.strip()}
+# 'sample' (collapsed stacks for flame graphs) or 'cprofile' (pstats dump)
+app.config['PROFILE_MODE'] = os.environ.get('PROFILE_MODE', 'sample')
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+# Defaults to instance/profiles
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
+# Background jobs: 'thread' runs them in-process, 'worker' leaves them for `flask run-worker`
+app.config['JOB_BACKEND'] = os.environ.get('JOB_BACKEND', 'thread')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+
+# Report request-scoped property cache hits/misses in an X-Derived-Cache header
+app.config['DERIVED_CACHE_STATS'] = os.environ.get('DERIVED_CACHE_STATS', 'False').lower() == 'true'
+
+# Largest accepted request body, e.g. a habit log import upload
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 32)) * 1024 * 1024
+
+# Per-user page snapshot cache: memory, redis://..., or off (see cache.py)
+app.config['SNAPSHOT_CACHE_URL'] = os.environ.get('SNAPSHOT_CACHE_URL', 'memory')
+# Upper bound on a snapshot's lifetime, for writes made outside the app
+app.config['SNAPSHOT_CACHE_TTL'] = int(os.environ.get('SNAPSHOT_CACHE_TTL', 3600))
 
 # Initialize extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'), render_as_batch=True)
 CORS(app)
+sqlite_tuning.register(app)
 
 # Import models and routes
 from models import User, Habit, HabitLog, AIInsight
 from routes import register_routes
+from commands import register_commands
+from memo import register_request_cache
+from metrics import register_metrics
+from cache import register_cache
+from sql_metrics import register_sql_metrics
+from profiling import register_profiling
 
-# Register routes
+# Register routes and CLI commands
 register_routes(app)
+register_commands(app)
+register_request_cache(app)
+register_metrics(app)
+register_replica(app)
+register_cache(app)
+register_sql_metrics(app)
+register_profiling(app)
 
-# Create database tables
-with app.app_context():
-    db.create_all()
+# Tables are created by `flask init-db` or migrations, not on import: every
+# gunicorn worker imports this module
 
 # Run the application
 if __name__ == '__main__':
@@ -0,0 +1,207 @@
+"""Latency and query-count benchmark for the hot paths.
+
+Drives the routes through the Flask test client as randomly chosen users of a
+database filled by ``datagen.py``. Reports latency percentiles and SQL
+statements per call, and compares them with a stored baseline:
+
+    python benchmarks/datagen.py --database sqlite:////tmp/bench.db --users 2000
+    python benchmarks/bench_routes.py --database sqlite:////tmp/bench.db --save-baseline
+    python benchmarks/bench_routes.py --database sqlite:////tmp/bench.db   # exits 1 on regression
+
+``--generate USERS`` builds a temporary database first instead. The snapshot
+cache is off unless ``--cache`` is given, so the dashboard's full computation
+is what gets measured.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+class Bench:
+    def __init__(self, app, db, seed):
+        from sqlalchemy import event
+        from models import User, Habit
+        self.app = app
+        self.random = random.Random(seed)
+        self.queries = 0
+        with app.app_context():
+            self.user_ids = [row[0] for row in db.session.query(User.id).join(Habit).distinct()]
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._count)
+        if not self.user_ids:
+            raise SystemExit('No users with habits; generate data with benchmarks/datagen.py first')
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def client_for(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+
+    def habit_of(self, user_id):
+        from app import db
+        from models import Habit
+        with self.app.app_context():
+            ids = [row[0] for row in db.session.query(Habit.id).filter_by(user_id=user_id, is_active=True)]
+        return self.random.choice(ids)
+
+    def run(self, name, call, iterations):
+        """Time ``call(user_id)`` for ``iterations`` random users"""
+        latencies, queries = [], []
+        for _ in range(iterations):
+            user_id = self.random.choice(self.user_ids)
+            prepared = call(user_id)
+            self.queries = 0
+            started = time.perf_counter()
+            prepared()
+            latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(self.queries)
+        return {
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'queries_mean': round(sum(queries) / len(queries), 1),
+            'queries_max': max(queries),
+        }
+
+
+def scenarios(bench):
+    """``{name: call}``; each call prepares a request for a user and returns the timed part"""
+
+    def get(path):
+        def prepare(user_id):
+            client = bench.client_for(user_id)
+            return lambda: check(client.get(path))
+        return prepare
+
+    def toggle(user_id):
+        client = bench.client_for(user_id)
+        habit_id = bench.habit_of(user_id)
+        return lambda: check(client.post(f'/habits/{habit_id}/toggle'), 302)
+
+    def in_request(func):
+        def prepare(user_id):
+            def timed():
+                from app import db
+                with bench.app.test_request_context():
+                    func(user_id)
+                    db.session.commit()
+            return timed
+        return prepare
+
+    from routes import recompute_user_stats, apply_stats_delta, generate_new_insight
+    return {
+        'dashboard': get('/dashboard'),
+        'toggle_habit': toggle,
+        'insights': get('/insights'),
+        # update_user_stats became an incremental UPDATE plus a full-recompute fallback
+        'apply_stats_delta': in_request(lambda user_id: apply_stats_delta(user_id, 0)),
+        'recompute_user_stats': in_request(recompute_user_stats),
+        'generate_new_insight': in_request(generate_new_insight),
+    }
+
+
+def check(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of ``results`` against ``baseline``"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {previous['p95_ms']}ms")
+        if result['queries_max'] > previous['queries_max']:
+            regressions.append(f"{name}: up to {result['queries_max']} queries vs baseline {previous['queries_max']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='Database URL; defaults to DATABASE_URL.')
+    parser.add_argument('--generate', type=int, metavar='USERS', help='Benchmark a fresh temporary database of USERS users.')
+    parser.add_argument('--days', type=int, default=365, help='Days of history for --generate.')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--scenario', action='append', help='Only run these scenarios.')
+    parser.add_argument('--cache', action='store_true', help='Keep the dashboard snapshot cache on.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown before failing.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='habit-bench-')
+    if args.generate:
+        args.database = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if args.database:
+        os.environ['DATABASE_URL'] = args.database
+    os.environ.setdefault('JOB_QUEUE_URL', f"sqlite:///{os.path.join(workdir, 'jobs.db')}")
+    os.environ['JOB_BACKEND'] = 'worker'  # queue insight jobs without running them
+    if not args.cache:
+        os.environ['SNAPSHOT_CACHE_URL'] = 'off'
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+        if args.generate:
+            from datagen import generate
+            counts = generate(args.generate, 5, args.days, 0.6, args.seed)
+            print(f"Generated {counts['user']} users, {counts['habit_log']} logs")
+
+    bench = Bench(app, db, args.seed)
+    results = {}
+    print(f"{'scenario':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'max':>5}")
+    for name, call in scenarios(bench).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        result = results[name] = bench.run(name, call, args.iterations)
+        print(f"{name:<22} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} "
+              f"{result['queries_mean']:>8} {result['queries_max']:>5}")
+
+    with app.app_context():
+        from models import HabitLog
+        logs = db.session.query(db.func.count(HabitLog.id)).scalar()
+    meta = {'users': len(bench.user_ids), 'habit_logs': logs, 'iterations': args.iterations,
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'meta': meta, 'scenarios': results}, baseline_file, indent=2, sort_keys=True)
+        print(f'Saved baseline to {args.baseline}')
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"Compared with baseline of {baseline['meta']['users']} users, {baseline['meta']['habit_logs']} logs:")
+        for regression in regressions:
+            print(f'  REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('  no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Synthetic data at production scale.
+
+Generates users with habits, completed-day logs, history bits, streaks,
+stats, goals and insights that are consistent with each other, using NumPy
+for the completion matrix and bulk INSERTs for the rows. A million HabitLog
+rows take a few seconds on SQLite.
+
+    python benchmarks/datagen.py --users 2000 --habits 5 --days 365 --probability 0.6
+
+The database comes from ``--database`` or ``DATABASE_URL``; tables are created
+if missing and generated ids follow any existing rows.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ['health', 'fitness', 'learning', 'productivity', 'mindfulness', 'social']
+COLORS = ['#6366f1', '#10b981', '#f59e0b', '#ef4444', '#8b5cf6', '#06b6d4']
+PASSWORD = 'benchmark'
+USERS_PER_CHUNK = 500
+ROWS_PER_INSERT = 50000
+
+
+def completion_matrix(rng, habits, days, probability):
+    """Habits x days 0/1 matrix; each habit gets its own completion rate around ``probability``"""
+    import numpy as np
+    rates = np.clip(rng.normal(probability, 0.15, size=(habits, 1)), 0.02, 0.98)
+    return (rng.random((habits, days)) < rates).astype(np.uint8)
+
+
+def streak_columns(matrix):
+    """Vectorized ``history.streaks`` over every row: ``(current, longest, last_index)``"""
+    import numpy as np
+    habits, days = matrix.shape
+    run = np.zeros(habits, dtype=np.int64)
+    longest = np.zeros(habits, dtype=np.int64)
+    current = np.zeros(habits, dtype=np.int64)
+    last = np.full(habits, -1, dtype=np.int64)
+    for day in range(days):
+        done = matrix[:, day].astype(bool)
+        run = np.where(done, run + 1, 0)
+        longest = np.maximum(longest, run)
+        current = np.where(done, run, current)
+        last = np.where(done, day, last)
+    return current, longest, last
+
+
+def insert_rows(connection, table, rows):
+    for offset in range(0, len(rows), ROWS_PER_INSERT):
+        connection.execute(table.insert(), rows[offset:offset + ROWS_PER_INSERT])
+
+
+def insert_logs(connection, habit_ids, dates, matrix):
+    """Insert a completed HabitLog row for every set cell of ``matrix``.
+
+    Logs are most of the data, so they skip SQLAlchemy's per-row parameter
+    processing and go to the driver's ``executemany`` as plain tuples.
+    """
+    import numpy as np
+    sqlite = connection.dialect.name == 'sqlite'
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    statement = (f'INSERT INTO habit_log (habit_id, date, completed) '
+                 f'VALUES ({placeholder}, {placeholder}, {placeholder})')
+    day_values = np.array([day.isoformat() if sqlite else day for day in dates], dtype=object)
+
+    habit_index, day_index = np.nonzero(matrix)
+    for offset in range(0, habit_index.size, ROWS_PER_INSERT):
+        window = slice(offset, offset + ROWS_PER_INSERT)
+        rows = list(zip(habit_ids[habit_index[window]].tolist(), day_values[day_index[window]].tolist(),
+                        [True] * len(habit_index[window])))
+        connection.exec_driver_sql(statement, rows)
+    return int(habit_index.size)
+
+
+def generate(users, habits_per_user, days, probability, seed=0, progress=None):
+    """Write the synthetic data through the app's models; call inside an app context.
+
+    Returns ``{table: rows_inserted}``.
+    """
+    import numpy as np
+    from app import db
+    from models import User, Habit, HabitStreak, HabitGoal, UserStats, AIInsight
+    from werkzeug.security import generate_password_hash
+    from datetime import datetime, timedelta
+
+    db.create_all()
+    rng = np.random.default_rng(seed)
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    started_at = datetime.combine(start, datetime.min.time())
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(PASSWORD)
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+
+    next_user_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    next_habit_id = (db.session.query(db.func.max(Habit.id)).scalar() or 0) + 1
+    counts = dict.fromkeys(['user', 'habit', 'habit_log', 'habit_streak', 'habit_goal', 'user_stats', 'ai_insight'], 0)
+    connection = db.session.connection()
+
+    for chunk_start in range(0, users, USERS_PER_CHUNK):
+        chunk_users = min(USERS_PER_CHUNK, users - chunk_start)
+        chunk_habits = chunk_users * habits_per_user
+        user_ids = np.arange(next_user_id, next_user_id + chunk_users)
+        habit_ids = np.arange(next_habit_id, next_habit_id + chunk_habits)
+        owners = np.repeat(user_ids, habits_per_user)
+        next_user_id += chunk_users
+        next_habit_id += chunk_habits
+
+        matrix = completion_matrix(rng, chunk_habits, days, probability)
+        bits = np.packbits(matrix, axis=1, bitorder='little')
+        current, longest, last = streak_columns(matrix)
+
+        user_rows = [{
+            'id': int(user_id), 'username': f'bench{user_id}', 'email': f'bench{user_id}@example.com',
+            'password_hash': password_hash, 'timezone': 'UTC', 'created_at': started_at, 'data_version': 0
+        } for user_id in user_ids]
+        habit_rows = [{
+            'id': int(habit_id), 'user_id': int(owner), 'name': f'Habit {index % habits_per_user + 1}',
+            'description': None, 'category': CATEGORIES[index % len(CATEGORIES)], 'frequency': 'daily',
+            'target_days': 1, 'color': COLORS[index % len(COLORS)], 'icon': 'fas fa-check-circle',
+            'is_active': True, 'created_at': started_at, 'history_start': start,
+            'history_bits': bits[index].tobytes()
+        } for index, (habit_id, owner) in enumerate(zip(habit_ids, owners))]
+        streak_rows = [{
+            'habit_id': int(habit_id), 'current_streak': int(current[index]), 'longest_streak': int(longest[index]),
+            'last_completed_date': dates[last[index]] if last[index] >= 0 else None, 'updated_at': now
+        } for index, habit_id in enumerate(habit_ids)]
+        goal_rows = [{
+            'habit_id': int(habit_id), 'title': 'Complete it for 7 days',
+            'description': 'Build consistency by completing this habit for a full week',
+            'target_value': 7, 'current_value': int(matrix[index, -1]), 'target_date': today + timedelta(days=7),
+            'is_achieved': False, 'created_at': now
+        } for index, habit_id in enumerate(habit_ids)]
+
+        # User stats follow expected_user_stats: the sum and max of current streaks
+        per_user = current.reshape(chunk_users, habits_per_user)
+        totals, best = per_user.sum(axis=1), per_user.max(axis=1)
+        stats_rows = [{
+            'user_id': int(user_id), 'total_habits_completed': int(total), 'total_points': int(total) * 10,
+            'level': int(total) * 10 // 100 + 1, 'longest_streak': int(top), 'achievement_mask': 0, 'last_updated': now
+        } for user_id, total, top in zip(user_ids, totals, best)]
+        insight_rows = [{
+            'user_id': int(user_id), 'type': kind, 'title': title, 'message': message,
+            'confidence': int(rng.integers(70, 96)), 'created_at': now - timedelta(hours=hours)
+        } for user_id in user_ids for kind, title, message, hours in (
+            ('motivation', 'Keep Going!', 'Consistency beats intensity. Show up today.', 3),
+            ('tip', 'Habit Building Tip', 'Attach new habits to existing routines.', 2),
+            ('trend', 'Steady Progress', 'Your completion rate has held steady this month.', 1),
+        )]
+
+        for table, rows in ((User.__table__, user_rows), (Habit.__table__, habit_rows),
+                            (HabitStreak.__table__, streak_rows), (HabitGoal.__table__, goal_rows),
+                            (UserStats.__table__, stats_rows), (AIInsight.__table__, insight_rows)):
+            insert_rows(connection, table, rows)
+            counts[table.name] += len(rows)
+        counts['habit_log'] += insert_logs(connection, habit_ids, dates, matrix)
+        db.session.commit()
+        connection = db.session.connection()
+        if progress:
+            progress(counts)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--habits', type=int, default=5, help='Habits per user.')
+    parser.add_argument('--days', type=int, default=365, help='Days of history.')
+    parser.add_argument('--probability', type=float, default=0.6, help='Mean daily completion probability.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='Database URL; defaults to DATABASE_URL.')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DATABASE_URL'] = args.database
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    started = time.perf_counter()
+    with app.app_context():
+        counts = generate(
+            args.users, args.habits, args.days, args.probability, args.seed,
+            progress=lambda counts: print(f"  {counts['user']} users, {counts['habit_log']} logs", flush=True)
+        )
+    elapsed = time.perf_counter() - started
+    print(f"Inserted {', '.join(f'{rows} {table}' for table, rows in counts.items())} in {elapsed:.1f}s "
+          f"({counts['habit_log'] / elapsed:,.0f} logs/s). Users log in with password '{PASSWORD}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Concurrent-writer benchmark for the SQLite tuning profile.
+
+Starts several processes, like gunicorn workers, that each toggle habits
+through the Flask app against one SQLite file for a fixed time, mixed with
+dashboard reads. The run is repeated with the tuning profile off and on, and
+the requests per second and failed requests ("database is locked" surfaces as
+HTTP 500) are reported.
+
+    python benchmarks/sqlite_writers.py --workers 4 --seconds 10 --read-ratio 0.5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HABITS_PER_USER = 5
+
+
+def configure(directory, tuning):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'habits.db')}"
+    os.environ['JOB_QUEUE_URL'] = f"sqlite:///{os.path.join(directory, 'jobs.db')}"
+    os.environ['JOB_BACKEND'] = 'worker'  # queue insight jobs without running them
+    os.environ['SQLITE_TUNING'] = 'on' if tuning else 'off'
+    sys.path.insert(0, ROOT)
+
+
+def setup(directory, tuning, users):
+    configure(directory, tuning)
+    from app import app, db
+    from models import User, Habit, HabitStreak
+    from datetime import datetime
+    with app.app_context():
+        db.create_all()
+        for n in range(users):
+            user = User(username=f'bench{n}', email=f'bench{n}@example.com', password_hash='-')
+            db.session.add(user)
+            db.session.flush()
+            for h in range(HABITS_PER_USER):
+                habit = Habit(name=f'Habit {h}', category='health', user_id=user.id,
+                              history_start=datetime.utcnow().date(), history_bits=b'')
+                db.session.add(habit)
+                db.session.flush()
+                db.session.add(HabitStreak(habit_id=habit.id))
+        db.session.commit()
+
+
+def worker(directory, tuning, user_id, seconds, read_ratio, results):
+    configure(directory, tuning)
+    from app import app
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    habit_ids = range((user_id - 1) * HABITS_PER_USER + 1, user_id * HABITS_PER_USER + 1)
+    writes = reads = failed = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if random.random() < read_ratio:
+            response = client.get('/dashboard')
+            reads += response.status_code == 200
+        else:
+            response = client.post(f'/api/habits/{random.choice(habit_ids)}/toggle')
+            writes += response.status_code == 200
+        failed += response.status_code != 200
+    results.put((writes, reads, failed))
+
+
+def run(workers, seconds, read_ratio, tuning):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        process = context.Process(target=setup, args=(directory, tuning, workers))
+        process.start()
+        process.join()
+
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(directory, tuning, n + 1, seconds, read_ratio, results))
+                     for n in range(workers)]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    writes, reads, failed = (sum(column) for column in zip(*totals))
+    return writes / seconds, reads / seconds, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--read-ratio', type=float, default=0.5, help='Share of requests that load the dashboard.')
+    args = parser.parse_args()
+
+    print(f'{args.workers} processes, {args.read_ratio:.0%} dashboard reads, {args.seconds:g}s each run')
+    print(f"{'profile':<10} {'toggles/s':>10} {'reads/s':>10} {'failed':>8}")
+    for tuning in (False, True):
+        writes, reads, failed = run(args.workers, args.seconds, args.read_ratio, tuning)
+        print(f"{'tuned' if tuning else 'default':<10} {writes:>10.1f} {reads:>10.1f} {failed:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Pluggable cache for per-user page snapshots.
+
+``SNAPSHOT_CACHE_URL`` selects the backend:
+
+* ``memory`` (default) or ``memory://?size=1024``: an LRU in each process
+* ``redis://host:6379/0``: a shared Redis-compatible server, for several
+  gunicorn workers or hosts (needs the ``redis`` package)
+* ``off``: no caching
+
+Keys embed the user's ``data_version``, which every write bumps, so entries
+never need explicit deletion: a write makes the old key unreachable and the
+LRU or TTL reclaims it.
+"""
+from flask import current_app
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+import pickle
+import threading
+import time
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+
+class LRUCache:
+    """Thread-safe in-process LRU whose entries also expire after their TTL"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """Pickled values in a Redis-compatible server, expired by the server"""
+
+    def __init__(self, url, prefix='habits:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        import redis
+        try:
+            value = self.client.get(self.prefix + key)
+        except redis.RedisError as error:
+            # An unreachable cache only costs a recomputation
+            current_app.logger.warning('Snapshot cache read failed: %s', error)
+            return None
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        import redis
+        try:
+            self.client.setex(self.prefix + key, int(ttl), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except redis.RedisError as error:
+            current_app.logger.warning('Snapshot cache write failed: %s', error)
+
+
+def create_cache(url):
+    """Build the backend described by ``url``"""
+    url = (url or 'memory').strip()
+    if url == 'off':
+        return NullCache()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisCache(url)
+    if url == 'memory' or url.startswith('memory://'):
+        size = parse_qs(urlparse(url).query).get('size', ['1024'])[0]
+        return LRUCache(int(size))
+    raise ValueError(f'Unknown SNAPSHOT_CACHE_URL {url!r}')
+
+
+def get_cache():
+    return current_app.extensions['snapshot_cache']
+
+
+def register_cache(app):
+    app.extensions['snapshot_cache'] = create_cache(app.config.get('SNAPSHOT_CACHE_URL'))
@@ -0,0 +1,332 @@
+import click
+import json
+import os
+import subprocess
+import sqlite3
+import sys
+import time
+from app import db
+from flask_migrate import upgrade, stamp
+from sqlalchemy import inspect
+from models import User, Habit, HabitStreak, UserStats
+from routes import expected_user_stats, recompute_goals
+import jobs
+import training
+import importer
+import exporter
+import profiling
+
+# Run in a fresh interpreter by `flask startup-profile`
+STARTUP_PROBE = '''
+import json, resource, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+'''
+
+def register_commands(app):
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create or upgrade the database schema.
+
+        Run once per deployment, before starting the web workers.
+        """
+        existing = inspect(db.engine).get_table_names()
+        if existing:
+            # Migrations also apply to databases first created with create_all()
+            upgrade()
+        db.create_all()
+        if not existing:
+            stamp()
+        click.echo('Database schema is up to date.')
+
+    @app.cli.command('startup-profile')
+    @click.option('--limit', default=15, show_default=True, help='Number of packages to list.')
+    def startup_profile(limit):
+        """Break down the cost of importing the app by module."""
+        probe = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_PROBE],
+            cwd=app.root_path, capture_output=True, text=True, env=os.environ.copy()
+        )
+        if probe.returncode != 0:
+            raise click.ClickException(probe.stderr.strip().splitlines()[-1])
+        summary = json.loads(probe.stdout.strip().splitlines()[-1])
+
+        # Lines look like "import time:  <self us> | <cumulative us> | <indented module>"
+        self_us, cumulative_us = {}, {}
+        for line in probe.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, cumulative, module = line[len('import time:'):].split('|')
+            module = module.strip()
+            package = module.split('.')[0]
+            self_us[package] = self_us.get(package, 0) + int(own)
+            cumulative_us[module] = int(cumulative)
+
+        click.echo(f"Importing app: {summary['seconds'] * 1000:.0f} ms, peak RSS {summary['max_rss_kb'] / 1024:.1f} MB")
+        click.echo()
+        click.echo('Application modules (import + init, cumulative):')
+        local_modules = {name[:-3] for name in os.listdir(app.root_path) if name.endswith('.py')}
+        for module in sorted(local_modules & cumulative_us.keys(), key=cumulative_us.get, reverse=True):
+            click.echo(f'  {module:<30} {cumulative_us[module] / 1000:>8.1f} ms')
+        click.echo()
+        click.echo(f'Top {limit} packages (self time):')
+        for package in sorted(self_us, key=self_us.get, reverse=True)[:limit]:
+            click.echo(f'  {package:<30} {self_us[package] / 1000:>8.1f} ms')
+
+    @app.cli.command('rebuild-streaks')
+    @click.option('--habit-id', type=int, help='Only rebuild the streak of this habit.')
+    @click.option('--user-id', type=int, help='Only rebuild streaks of this user\'s habits.')
+    def rebuild_streaks(habit_id, user_id):
+        """Recompute habit history bits and streaks from HabitLog."""
+        query = Habit.query
+        if habit_id:
+            query = query.filter_by(id=habit_id)
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+
+        rebuilt = 0
+        user_ids = set()
+        for habit in query.yield_per(500):
+            habit.rebuild_history()
+            HabitStreak.for_habit(habit).rebuild()
+            user_ids.add(habit.user_id)
+            rebuilt += 1
+            if rebuilt % 500 == 0:
+                db.session.commit()
+        # Cached page snapshots of every affected user are now stale
+        if habit_id or user_id:
+            if user_ids:
+                User.bump_data_version(*user_ids)
+        elif user_ids:
+            User.bump_data_version()
+        db.session.commit()
+
+        click.echo(f'Rebuilt {rebuilt} habit streak(s).')
+
+    @app.cli.command('reconcile-stats')
+    @click.option('--user-id', type=int, help='Only check this user.')
+    @click.option('--fix', is_flag=True, help='Overwrite drifted stats with the recomputed values.')
+    def reconcile_stats(user_id, fix):
+        """Verify incrementally maintained UserStats against a full recompute."""
+        expected = expected_user_stats(user_id)
+        query = UserStats.query
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+
+        checked = drifted = 0
+        fixed = []
+        for user_stats in query.yield_per(1000):
+            checked += 1
+            total_completed, longest_streak = expected.get(user_stats.user_id, (0, 0))
+            total_points = total_completed * 10
+            if (user_stats.total_habits_completed == total_completed
+                    and user_stats.total_points == total_points
+                    and user_stats.level == total_points // 100 + 1
+                    and (user_stats.longest_streak or 0) >= longest_streak):
+                continue
+
+            drifted += 1
+            click.echo(
+                f'User {user_stats.user_id}: completed {user_stats.total_habits_completed} != {total_completed}, '
+                f'points {user_stats.total_points} != {total_points}, '
+                f'longest streak {user_stats.longest_streak} (expected >= {longest_streak})'
+            )
+            if fix:
+                user_stats.total_habits_completed = total_completed
+                user_stats.total_points = total_points
+                user_stats.level = total_points // 100 + 1
+                user_stats.longest_streak = max(user_stats.longest_streak or 0, longest_streak)
+                fixed.append(user_stats.user_id)
+
+        if fixed:
+            User.bump_data_version(*fixed)
+        if fix:
+            db.session.commit()
+        click.echo(f'Checked {checked} user(s), {drifted} drifted{" and fixed" if fix and drifted else ""}.')
+
+    @app.cli.command('recompute-goals')
+    @click.option('--user-id', type=int, help='Only recompute this user\'s goals.')
+    def recompute_goals_command(user_id):
+        """Recompute open goal progress from HabitLog in one grouped query."""
+        changed = recompute_goals(user_id)
+        if changed and user_id is not None:
+            User.bump_data_version(user_id)
+        elif changed:
+            # Without --user-id every user's goals may have changed
+            User.bump_data_version()
+        db.session.commit()
+        click.echo(f'Updated {changed} goal(s).')
+
+    @app.cli.command('run-worker')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+    @click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+    def run_worker(poll_interval, once):
+        """Run queued background jobs (for JOB_BACKEND=worker)."""
+        click.echo('Worker started, waiting for jobs...')
+        jobs.work(poll_interval=poll_interval, once=once)
+
+    @app.cli.command('train-insights')
+    @click.option('--chunk-size', default=1000, show_default=True, help='Users per batch.')
+    @click.option('--workers', default=1, show_default=True, help='Processes fitting batches in parallel.')
+    @click.option('--user-id', type=int, help='Only train insights for this user.')
+    def train_insights(chunk_size, workers, user_id):
+        """Fit completion trends and forecasts for all users and store them as insights."""
+        started = time.perf_counter()
+        users, insights = training.train_insights(
+            chunk_size=chunk_size, workers=workers, user_id=user_id,
+            progress=lambda users, insights: click.echo(f'  {users} user(s), {insights} insight(s)...')
+        )
+        click.echo(f'Trained {insights} insight(s) for {users} user(s) in {time.perf_counter() - started:.1f}s.')
+
+    @app.cli.command('import-logs')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--user', 'user_ref', required=True, help='Username or email of the owner.')
+    @click.option('--format', 'fmt', type=click.Choice(importer.FORMATS), help='Defaults to the file extension.')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+    @click.option('--create-habits', is_flag=True, help='Create habits that don\'t exist yet.')
+    def import_logs(path, user_ref, fmt, batch_size, create_habits):
+        """Import habit logs from a CSV or JSON Lines file."""
+        user = User.query.filter((User.username == user_ref) | (User.email == user_ref)).first()
+        if not user:
+            raise click.ClickException(f'No user named {user_ref}')
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                summary = importer.import_logs(
+                    user.id, stream, fmt=importer.detect_format(path, fmt),
+                    batch_size=batch_size, create_habits=create_habits
+                )
+        except importer.ImportFileError as error:
+            if error.summary and error.summary['imported']:
+                raise click.ClickException(f"{error} (after importing {error.summary['imported']} row(s))")
+            raise click.ClickException(str(error))
+        
+        for error in summary['errors']:
+            click.echo(f"  line {error['line']}: {error['error']}", err=True)
+        click.echo(
+            f"Read {summary['rows']} row(s): {summary['imported']} imported, "
+            f"{summary['duplicates']} duplicate(s), {summary['invalid']} invalid, "
+            f"{summary['habits_created']} habit(s) created."
+        )
+
+    @app.cli.command('export-logs')
+    @click.option('--user', 'user_ref', required=True, help='Username or email of the owner.')
+    @click.option('--format', 'fmt', type=click.Choice(exporter.FORMATS), default='csv', show_default=True)
+    @click.option('--type', 'kind', type=click.Choice(exporter.TYPES + ('all',)), help='Defaults to logs for csv, all for jsonl.')
+    @click.option('--output', '-o', type=click.File('w'), default='-', help='Defaults to stdout.')
+    def export_logs(user_ref, fmt, kind, output):
+        """Export one user's data as CSV or JSON Lines."""
+        user = User.query.filter((User.username == user_ref) | (User.email == user_ref)).first()
+        if not user:
+            raise click.ClickException(f'No user named {user_ref}')
+        try:
+            kinds = exporter.parse_types(kind, fmt)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+        for chunk in exporter.stream(fmt, kinds, user.id):
+            output.write(chunk)
+
+    @app.cli.command('export-all')
+    @click.argument('directory', type=click.Path(file_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(exporter.FORMATS), default='jsonl', show_default=True)
+    @click.option('--type', 'kind', type=click.Choice(exporter.TYPES + ('all',)), help='Defaults to logs for csv, all for jsonl.')
+    @click.option('--shard-size', default=10000, show_default=True, help='User ids per output file.')
+    def export_all(directory, fmt, kind, shard_size):
+        """Export every user's data, one file per range of user ids."""
+        try:
+            kinds = exporter.parse_types(kind, fmt)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+        os.makedirs(directory, exist_ok=True)
+        max_user_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        name = kinds[0] if len(kinds) == 1 else 'export'
+        written = 0
+        for first in range(1, max_user_id + 1, shard_size):
+            last = first + shard_size - 1
+            path = os.path.join(directory, f'{name}-users-{first:09d}-{last:09d}.{fmt}')
+            with open(path, 'w', newline='') as output:
+                for chunk in exporter.stream(fmt, kinds, first, last):
+                    output.write(chunk)
+            # Ranges without any users leave at most a CSV header behind
+            if not User.query.filter(User.id.between(first, last)).first():
+                os.remove(path)
+                continue
+            written += 1
+            click.echo(f'  wrote {path}')
+        click.echo(f'Exported users 1-{max_user_id} into {written} file(s).')
+
+    @app.cli.command('sync-replica')
+    @click.option('--interval', type=float, help='Keep copying every INTERVAL seconds.')
+    def sync_replica(interval):
+        """Copy the primary SQLite database into the replica (local testing)."""
+        if 'replica' not in db.engines:
+            raise click.ClickException('DATABASE_REPLICA_URL is not set')
+        primary, replica = db.engines[None].url, db.engines['replica'].url
+        if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+            raise click.ClickException('sync-replica only copies SQLite databases; use streaming replication for Postgres')
+        while True:
+            source = sqlite3.connect(primary.database)
+            target = sqlite3.connect(replica.database)
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            click.echo(f'Copied {primary.database} to {replica.database}')
+            if not interval:
+                break
+            time.sleep(interval)
+
+    @app.cli.group('profiles')
+    def profiles():
+        """Read per-request profiles written by profiling.py."""
+
+    @profiles.command('list')
+    @click.option('--limit', default=20, show_default=True, help='Number of profiles to list, newest first.')
+    @click.option('--endpoint', help='Only profiles of this endpoint.')
+    def list_profiles(limit, endpoint):
+        """List captured profiles."""
+        found = [summary for summary in profiling.summaries(app) if not endpoint or summary['endpoint'] == endpoint]
+        if not found:
+            click.echo(f'No profiles in {profiling.profile_dir(app)}')
+            return
+        click.echo(f"{'id':<48} {'trigger':<7} {'user':>6} {'status':>6} {'wall ms':>9} {'sql':>4} {'sql ms':>8}")
+        for summary in found[:limit]:
+            click.echo(f"{summary['id']:<48} {summary['trigger']:<7} {summary['user_id'] or '-':>6} "
+                       f"{summary['status']:>6} {summary['wall_ms']:>9.1f} {summary['sql_count']:>4} {summary['sql_ms']:>8.1f}")
+
+    @profiles.command('show')
+    @click.argument('profile_id')
+    @click.option('--top', default=15, show_default=True, help='Frames and statements to show.')
+    def show_profile(profile_id, top):
+        """Summarize one profile (a unique id prefix is enough)."""
+        try:
+            summary = profiling.load(app, profile_id)
+        except LookupError as error:
+            raise click.ClickException(str(error))
+        path = os.path.join(profiling.profile_dir(app), summary['id'])
+        click.echo(f"{summary['method']} {summary['path']} ({summary['endpoint']}) -> {summary['status']}, "
+                   f"user {summary['user_id']}, {summary['trigger']} at {summary['created_at']}")
+        click.echo(f"Wall {summary['wall_ms']:.1f}ms, CPU {summary['cpu_ms']:.1f}ms, "
+                   f"SQL {summary['sql_ms']:.1f}ms in {summary['sql_count']} statements")
+
+        click.echo('\nSQL by total time:')
+        for shape, count, ms in profiling.top_statements(summary['statements'], top):
+            click.echo(f'  {ms:8.1f}ms {count:>4}x  {shape[:120]}')
+
+        if summary['mode'] == 'cprofile':
+            import pstats
+            click.echo('\nFunctions by cumulative time:')
+            pstats.Stats(path + '.prof', stream=sys.stdout).sort_stats('cumulative').print_stats(top)
+            return
+        own, total = profiling.top_frames(path + '.folded', top)
+        samples = summary['samples'] or 1
+        click.echo(f"\n{summary['samples']} samples every {summary['interval_ms']:g}ms. Inclusive:")
+        for frame, count in total:
+            click.echo(f'  {count / samples:6.1%}  {frame}')
+        click.echo('Self:')
+        for frame, count in own:
+            click.echo(f'  {count / samples:6.1%}  {frame}')
+        click.echo(f'\nFlame graph: flamegraph.pl {path}.folded > flame.svg (or open it in speedscope)')
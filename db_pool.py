@@ -0,0 +1,107 @@
+"""Connection pool configuration for server databases (Postgres).
+
+Each gunicorn worker process has its own pool, so the pool is sized from the
+worker and thread counts: every request thread and in-process job thread can
+hold a connection, and overflow is capped so that all workers together stay
+under the database's connection limit. Settings can be overridden from the
+environment (``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``, ...).
+
+With ``DB_PGBOUNCER=true`` the app connects through a PgBouncer in
+transaction-pooling mode: PgBouncer does the pooling, so the app opens a
+connection per checkout and never uses server-side prepared statements.
+"""
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool, QueuePool
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                for index, bound in enumerate(WAIT_BUCKETS):
+                    if waited <= bound:
+                        self.wait_buckets[index] += 1
+
+    def stats(self):
+        """Snapshot of the pool's gauges and checkout counters"""
+        with self._metrics_lock:
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'wait_buckets': list(zip(WAIT_BUCKETS, self.wait_buckets)),
+            }
+
+
+def _flag(environ, name, default):
+    return environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(database_url, environ=None):
+    """Return ``SQLALCHEMY_ENGINE_OPTIONS`` for ``database_url``.
+
+    SQLite keeps SQLAlchemy's defaults; see sqlite_tuning.py for its settings.
+    """
+    environ = os.environ if environ is None else environ
+    if database_url.startswith('sqlite'):
+        return {}
+
+    if _flag(environ, 'DB_PGBOUNCER', 'false'):
+        options = {'poolclass': NullPool}
+        if database_url.startswith('postgresql+psycopg:'):
+            # psycopg 3 prepares repeated statements, which breaks under transaction pooling
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+
+    workers = int(environ.get('WEB_CONCURRENCY', 1))
+    threads = int(environ.get('GUNICORN_THREADS', 1))
+    job_threads = int(environ.get('JOB_WORKERS', 2)) if environ.get('JOB_BACKEND', 'thread') == 'thread' else 0
+    # Leave some server connections for migrations, workers and psql sessions
+    budget = max(int(environ.get('DB_MAX_CONNECTIONS', 100)) - int(environ.get('DB_RESERVED_CONNECTIONS', 10)), workers)
+
+    per_worker = budget // workers
+    pool_size = int(environ.get('DB_POOL_SIZE', min(threads + job_threads, per_worker)))
+    max_overflow = int(environ.get('DB_MAX_OVERFLOW', max(min(pool_size, per_worker - pool_size), 0)))
+    return {
+        'poolclass': MeteredQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _flag(environ, 'DB_POOL_PRE_PING', 'true'),
+    }
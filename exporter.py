@@ -0,0 +1,118 @@
+"""Streaming export of users' habits, logs, goals and achievements.
+
+Every export is a generator over a server-side cursor (``yield_per``), so
+memory stays flat however much history a user has. Output is CSV (one record
+type per file) or JSON Lines (any mix of types, each line tagged with
+``type``). The ``logs`` CSV uses the same columns as the importer, so an export
+can be imported into another account unchanged.
+"""
+from app import db
+from models import Habit, HabitLog, HabitGoal, Achievement
+from sqlalchemy import select
+import csv
+import io
+import json
+
+FORMATS = ('csv', 'jsonl')
+TYPES = ('habits', 'logs', 'goals', 'achievements')
+YIELD_PER = 1000
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def _habits(first_user_id, last_user_id):
+    return select(
+        Habit.user_id, Habit.id.label('habit_id'), Habit.name, Habit.description, Habit.category,
+        Habit.frequency, Habit.color, Habit.icon, Habit.is_active, Habit.created_at
+    ).where(Habit.user_id.between(first_user_id, last_user_id)).order_by(Habit.user_id, Habit.id)
+
+
+def _logs(first_user_id, last_user_id):
+    return select(
+        Habit.user_id, HabitLog.habit_id, Habit.name.label('habit'), HabitLog.date, HabitLog.completed
+    ).join(Habit, Habit.id == HabitLog.habit_id).where(
+        Habit.user_id.between(first_user_id, last_user_id)
+    ).order_by(Habit.user_id, HabitLog.habit_id, HabitLog.date)
+
+
+def _goals(first_user_id, last_user_id):
+    return select(
+        Habit.user_id, HabitGoal.habit_id, Habit.name.label('habit'), HabitGoal.title, HabitGoal.description,
+        HabitGoal.target_value, HabitGoal.current_value, HabitGoal.target_date, HabitGoal.is_achieved,
+        HabitGoal.created_at
+    ).join(Habit, Habit.id == HabitGoal.habit_id).where(
+        Habit.user_id.between(first_user_id, last_user_id)
+    ).order_by(Habit.user_id, HabitGoal.habit_id, HabitGoal.id)
+
+
+def _achievements(first_user_id, last_user_id):
+    return select(
+        Achievement.user_id, Achievement.name, Achievement.description, Achievement.points, Achievement.unlocked_at
+    ).where(Achievement.user_id.between(first_user_id, last_user_id)).order_by(Achievement.user_id, Achievement.id)
+
+
+QUERIES = {'habits': _habits, 'logs': _logs, 'goals': _goals, 'achievements': _achievements}
+
+
+def iter_records(kind, first_user_id, last_user_id=None):
+    """Yield ``(columns, row)`` for every ``kind`` record of the users in the id range"""
+    stmt = QUERIES[kind](first_user_id, first_user_id if last_user_id is None else last_user_id)
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    columns = list(result.keys())
+    for row in result:
+        yield columns, row
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def stream_csv(kind, first_user_id, last_user_id=None):
+    """Yield CSV text chunks, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(QUERIES[kind](0, 0).selected_columns.keys())
+    count = 0
+    for _, row in iter_records(kind, first_user_id, last_user_id):
+        writer.writerow([_value(value) for value in row])
+        count += 1
+        if count % YIELD_PER == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_jsonl(kinds, first_user_id, last_user_id=None):
+    """Yield JSON Lines text chunks covering each type in ``kinds``"""
+    lines = []
+    for kind in kinds:
+        for columns, row in iter_records(kind, first_user_id, last_user_id):
+            record = {'type': kind[:-1]}
+            record.update(zip(columns, map(_value, row)))
+            lines.append(json.dumps(record))
+            if len(lines) == YIELD_PER:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream(fmt, kinds, first_user_id, last_user_id=None):
+    """Yield export chunks in ``fmt``; CSV exports take exactly one type"""
+    if fmt == 'csv':
+        if len(kinds) != 1:
+            raise ValueError('CSV exports contain exactly one type')
+        return stream_csv(kinds[0], first_user_id, last_user_id)
+    return stream_jsonl(kinds, first_user_id, last_user_id)
+
+
+def parse_types(value, fmt):
+    """Turn a ``type`` argument (a type or "all") into a list of types"""
+    value = value or ('logs' if fmt == 'csv' else 'all')
+    if value == 'all':
+        if fmt == 'csv':
+            raise ValueError('CSV exports contain exactly one type; use jsonl for "all"')
+        return list(TYPES)
+    if value not in TYPES:
+        raise ValueError(f"type must be one of {', '.join(TYPES)} or all")
+    return [value]
@@ -0,0 +1,134 @@
+"""Compact per-habit completion history: one bit per day.
+
+Bit ``i`` (little-endian within each byte) is set when the habit was completed
+on ``start + i days``. Five years of history fit in under 230 bytes, and every
+statistic below is a handful of vectorized NumPy operations over the unpacked
+bits instead of an iteration over HabitLog rows.
+"""
+from datetime import timedelta
+
+
+def from_dates(dates, start):
+    """Pack an iterable of completed dates (all >= ``start``) into history bits"""
+    import numpy as np
+    offsets = np.fromiter(((day - start).days for day in dates), dtype=np.int64)
+    if not offsets.size:
+        return b''
+    days = np.zeros(offsets.max() + 1, dtype=np.uint8)
+    days[offsets] = 1
+    return np.packbits(days, bitorder='little').tobytes()
+
+
+def unpack(bits):
+    """Return the history as a 0/1 uint8 array, one element per day from ``start``"""
+    import numpy as np
+    return np.unpackbits(np.frombuffer(bits or b'', dtype=np.uint8), bitorder='little')
+
+
+def set_day(bits, start, day, completed):
+    """Set or clear ``day`` and return the new ``(bits, start)``.
+
+    Days before ``start`` move the start back by whole bytes so existing bits
+    keep their positions.
+    """
+    bits = bytearray(bits or b'')
+    if start is None:
+        start = day
+    if day < start:
+        shift = -(-(start - day).days // 8)
+        bits[:0] = bytes(shift)
+        start -= timedelta(days=shift * 8)
+
+    index, bit = divmod((day - start).days, 8)
+    if index >= len(bits):
+        if not completed:
+            return bytes(bits), start
+        bits.extend(bytes(index - len(bits) + 1))
+    if completed:
+        bits[index] |= 1 << bit
+    else:
+        bits[index] &= ~(1 << bit) & 0xFF
+    return bytes(bits), start
+
+
+def is_set(bits, start, day):
+    """Whether ``day`` is marked completed"""
+    if not bits or start is None or day < start:
+        return False
+    index, bit = divmod((day - start).days, 8)
+    return index < len(bits) and bool(bits[index] >> bit & 1)
+
+
+def count_between(bits, start, first=None, last=None):
+    """Number of completed days in ``[first, last]`` (open ends are unbounded)"""
+    import numpy as np
+    days = unpack(bits)
+    if start is None or not days.size:
+        return 0
+    lo = max((first - start).days, 0) if first else 0
+    hi = (last - start).days + 1 if last else days.size
+    if hi <= lo:
+        return 0
+    return int(np.count_nonzero(days[lo:hi]))
+
+
+def streaks(bits, start):
+    """Return ``(current, longest, last_completed_date)``.
+
+    ``current`` is the run of completed days ending at the last completed day.
+    """
+    import numpy as np
+    completed = np.flatnonzero(unpack(bits))
+    if start is None or not completed.size:
+        return 0, 0, None
+
+    # Runs break wherever two completed days are not adjacent
+    breaks = np.flatnonzero(np.diff(completed) != 1)
+    run_starts = np.concatenate(([0], breaks + 1))
+    run_ends = np.concatenate((breaks, [completed.size - 1]))
+    lengths = run_ends - run_starts + 1
+
+    last = start + timedelta(days=int(completed[-1]))
+    return int(lengths[-1]), int(lengths.max()), last
+
+
+RESOLUTIONS = ('day', 'week', 'month')
+
+
+def aggregate(bits, start, first, last, resolution='day'):
+    """Completed-day counts per period between ``first`` and ``last`` inclusive.
+
+    Returns ``[(period_start, completed, days), ...]`` where weeks start on
+    Monday and ``days`` is the number of days of the period inside the range.
+    """
+    import numpy as np
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'Unknown resolution: {resolution}')
+    if last < first:
+        return []
+
+    dates = np.arange(np.datetime64(first, 'D'), np.datetime64(last + timedelta(days=1), 'D'))
+    completed = np.zeros(dates.size, dtype=np.int64)
+    days = unpack(bits)
+    if start is not None and days.size:
+        # Copy the overlap of [first, last] with the stored history
+        lo = (first - start).days
+        src_lo, src_hi = max(lo, 0), min(lo + dates.size, days.size)
+        if src_hi > src_lo:
+            completed[src_lo - lo:src_hi - lo] = days[src_lo:src_hi]
+
+    if resolution == 'day':
+        periods = dates
+    elif resolution == 'week':
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday
+        periods = dates - (dates.astype(np.int64) + 3) % 7
+    else:
+        periods = dates.astype('datetime64[M]').astype('datetime64[D]')
+
+    boundaries = np.flatnonzero(np.concatenate(([True], periods[1:] != periods[:-1])))
+    counts = np.add.reduceat(completed, boundaries)
+    lengths = np.diff(np.concatenate((boundaries, [dates.size])))
+    return [
+        (period.item(), int(count), int(length))
+        for period, count, length in zip(periods[boundaries], counts, lengths)
+    ]
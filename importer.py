@@ -0,0 +1,183 @@
+"""Bulk import of habit logs from other trackers.
+
+Input is streamed row by row from CSV (with a header row) or JSON Lines. Each
+row names a habit, a ``date`` (YYYY-MM-DD) and optionally ``completed``
+(defaults to true)::
+
+    habit,date,completed
+    Morning Run,2023-01-05,true
+
+Rows are validated, mapped to the user's habits by name (case-insensitive) and
+bulk-inserted in transactions of ``batch_size`` rows; days that already have a
+log are left untouched. History bits, streaks, goals and user stats are
+recomputed once for the affected habits after the last batch, or after the
+last committed batch when the file turns out to be unreadable part way.
+"""
+from app import db
+from models import User, Habit, HabitLog, HabitStreak
+from datetime import datetime
+import analytics
+import csv
+import io
+import json
+
+FORMATS = ('csv', 'jsonl')
+MAX_ERRORS = 50  # per-row errors reported back; the rest are only counted
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'done', 'completed'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', ''}
+
+
+class ImportFileError(ValueError):
+    """The import file as a whole cannot be read.
+
+    ``summary`` holds the counts of the batches committed before the error.
+    """
+
+    def __init__(self, message, summary=None):
+        super().__init__(message)
+        self.summary = summary
+
+
+def detect_format(filename, fmt=None):
+    """Pick the input format from an explicit ``fmt`` or the file extension"""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ImportFileError(f"Format must be one of {', '.join(FORMATS)}")
+        return fmt
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row_dict)`` from a text stream without loading it whole"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        if not reader.fieldnames or not {'habit', 'date'} <= {name.strip().lower() for name in reader.fieldnames}:
+            raise ImportFileError('CSV header must include "habit" and "date" columns')
+        for row in reader:
+            yield reader.line_num, {(key or '').strip().lower(): value for key, value in row.items()}
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def parse_row(row, habit_ids, allow_new=False):
+    """Return ``(habit_id, date, completed)`` for a raw row or raise ValueError.
+
+    With ``allow_new``, an unknown habit name is not an error and gives a
+    ``habit_id`` of None.
+    """
+    if row is None:
+        raise ValueError('not a JSON object')
+    name = str(row.get('habit') or '').strip()
+    if not name:
+        raise ValueError('missing habit name')
+    habit_id = habit_ids.get(name.casefold())
+    if habit_id is None and not allow_new:
+        raise ValueError(f'unknown habit "{name}"')
+
+    try:
+        day = datetime.strptime(str(row.get('date') or '').strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('date must be formatted as YYYY-MM-DD')
+    if day > datetime.utcnow().date():
+        raise ValueError('date is in the future')
+
+    completed = row.get('completed', True)
+    if not isinstance(completed, bool):
+        value = str(completed if completed is not None else '').strip().lower()
+        if value in TRUE_VALUES:
+            completed = True
+        elif value in FALSE_VALUES:
+            completed = False
+        else:
+            raise ValueError(f'completed must be true or false, not "{completed}"')
+    return habit_id, day, completed
+
+
+def import_logs(user_id, stream, fmt='csv', batch_size=1000, create_habits=False):
+    """Import logs for ``user_id`` from a text ``stream``; returns a summary dict.
+
+    With ``create_habits``, rows naming an unknown habit create it (category
+    "Imported") instead of being rejected.
+    """
+    habit_ids = {habit.name.strip().casefold(): habit.id for habit in Habit.query.filter_by(user_id=user_id)}
+    summary = {'rows': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'habits_created': 0, 'errors': []}
+    committed = set()
+    batch = {}
+
+    def flush():
+        rows = [{'habit_id': habit_id, 'date': day, 'completed': completed}
+                for (habit_id, day), completed in batch.items()]
+        inserted = HabitLog.insert_missing(rows)
+        db.session.commit()
+        summary['imported'] += inserted
+        summary['duplicates'] += len(rows) - inserted
+        committed.update(habit_id for habit_id, _ in batch)
+        batch.clear()
+
+    try:
+        for line_number, row in read_rows(stream, fmt):
+            summary['rows'] += 1
+            try:
+                habit_id, day, completed = parse_row(row, habit_ids, allow_new=create_habits)
+            except ValueError as error:
+                summary['invalid'] += 1
+                if len(summary['errors']) < MAX_ERRORS:
+                    summary['errors'].append({'line': line_number, 'error': str(error)})
+                continue
+            if habit_id is None:
+                # Only a row that is otherwise valid creates its habit
+                name = str(row['habit']).strip()
+                habit = Habit(name=name[:100], category='Imported', user_id=user_id)
+                db.session.add(habit)
+                db.session.flush()
+                habit_id = habit_ids[name.casefold()] = habit.id
+                summary['habits_created'] += 1
+
+            # Repeated days within the file count once; the last row wins
+            if (habit_id, day) in batch:
+                summary['duplicates'] += 1
+            batch[(habit_id, day)] = completed
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as error:
+        # Earlier batches stay imported; bring their derived state up to date
+        db.session.rollback()
+        if committed:
+            finish_import(user_id, committed)
+        raise ImportFileError(str(error), summary) from error
+
+    if committed:
+        finish_import(user_id, committed)
+    return summary
+
+
+def finish_import(user_id, habit_ids):
+    """Recompute derived state of the imported habits and the user's stats once"""
+    # routes imports this module, so these helpers are imported on use
+    from routes import recompute_goals, recompute_user_stats
+    for habit in Habit.query.filter(Habit.id.in_(habit_ids)):
+        habit.rebuild_history()
+        if habit.streak_record is None:
+            HabitStreak.for_habit(habit)  # builds the new record from the history
+        else:
+            habit.streak_record.rebuild()
+    recompute_goals(user_id)
+    recompute_user_stats(user_id)
+    User.bump_data_version(user_id)
+    db.session.commit()
+    analytics.invalidate(user_id)
+
+
+def text_stream(binary):
+    """Wrap an uploaded binary file for streaming text reads (UTF-8, BOM tolerated)"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
@@ -0,0 +1,143 @@
+"""Background jobs backed by a queue table in a local SQLite database.
+
+Jobs are recorded in ``Job`` (the ``jobs`` bind, ``JOB_QUEUE_URL``) so their
+status can be polled from any worker process. With ``JOB_BACKEND=thread`` (the
+default) each web process runs them on a bounded thread pool; with
+``JOB_BACKEND=worker`` they stay queued for ``flask run-worker``. Either way a
+job is claimed with a conditional UPDATE, so it runs exactly once.
+
+The queue database is not covered by the migrations: its table is created on
+first use (and by ``flask init-db``).
+"""
+from app import db
+from models import Job
+from flask import current_app
+from sqlalchemy import update, inspect
+from sqlalchemy.exc import OperationalError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import threading
+import time
+
+JOB_HANDLERS = {}
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+_queue_ready = False
+
+
+def job_handler(kind):
+    """Register ``func(**payload)`` as the handler for jobs of ``kind``.
+
+    The handler runs inside an app context and returns a JSON-serialisable result.
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, user_id=None, **payload):
+    """Queue a job and, with the thread backend, start it if a slot is free.
+
+    ``user_id`` owns the job for status polling and is passed to the handler.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+
+    ensure_queue()
+    if user_id is not None:
+        payload['user_id'] = user_id
+    job = Job(kind=kind, user_id=user_id, payload=json.dumps(payload))
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    if app.config['JOB_BACKEND'] == 'thread':
+        executor, slots = _get_executor(app)
+        # A full pool leaves the job queued; the next free thread drains it
+        if slots.acquire(blocking=False):
+            executor.submit(_run_and_drain, app, job.id).add_done_callback(lambda _: slots.release())
+    return job
+
+
+def ensure_queue():
+    """Create the queue table if this process has not seen it yet"""
+    global _queue_ready
+    if not _queue_ready:
+        try:
+            Job.__table__.create(db.engines['jobs'], checkfirst=True)
+        except OperationalError:
+            # Another process created it between the check and the CREATE
+            if not inspect(db.engines['jobs']).has_table(Job.__tablename__):
+                raise
+        _queue_ready = True
+
+
+def run_job(job_id):
+    """Claim and run one queued job; returns False if it was already claimed"""
+    claimed = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return False
+
+    job = db.session.get(Job, job_id)
+    try:
+        result = JOB_HANDLERS[job.kind](**json.loads(job.payload or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+        job = db.session.get(Job, job_id)
+        job.status, job.error = 'failed', str(e)
+    else:
+        job.status, job.result = 'done', json.dumps(result)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def claim_next():
+    """Run the oldest queued job, returning False when the queue is empty"""
+    while True:
+        job_id = db.session.query(Job.id).filter_by(status='queued').order_by(Job.id).limit(1).scalar()
+        db.session.commit()
+        if job_id is None:
+            return False
+        if run_job(job_id):
+            return True
+
+
+def work(poll_interval=1.0, once=False):
+    """Worker loop for ``JOB_BACKEND=worker``: run queued jobs as they arrive"""
+    ensure_queue()
+    while True:
+        ran = claim_next()
+        if once and not ran:
+            return
+        if not ran:
+            time.sleep(poll_interval)
+
+
+def _get_executor(app):
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = app.config['JOB_WORKERS']
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+            _slots = threading.BoundedSemaphore(workers)
+    return _executor, _slots
+
+
+def _run_and_drain(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+            while claim_next():
+                pass
+        finally:
+            db.session.remove()
@@ -0,0 +1,156 @@
+"""Batched loaders that fetch everything a page needs in a fixed number of queries."""
+from app import db
+from models import Habit, HabitStreak, HabitGoal, UserStats, Achievement, AIInsight
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import history
+
+
+def plain(obj, *fields):
+    """Copy ``fields`` of a model instance into a detached, picklable namespace"""
+    return SimpleNamespace(**{field: getattr(obj, field) for field in fields})
+
+GOAL_FIELDS = ('id', 'title', 'current_value', 'target_value', 'progress_percentage', 'is_achieved')
+USER_STATS_FIELDS = ('level', 'total_points', 'total_habits_completed', 'longest_streak', 'progress_to_next_level')
+ACHIEVEMENT_FIELDS = ('name', 'description', 'icon', 'color', 'points', 'unlocked_at')
+INSIGHT_FIELDS = ('id', 'type', 'title', 'message', 'confidence', 'created_at')
+
+
+class HabitView:
+    """Precomputed, read-only view of a habit for the dashboard template"""
+
+    def __init__(self, habit, completed_today=False, streak=0, completion_rate=0, goals=None,
+                 longest_streak=0, completed_days=0, total_days=0):
+        self.id = habit.id
+        self.name = habit.name
+        self.description = habit.description
+        self.category = habit.category
+        self.frequency = habit.frequency
+        self.color = habit.color
+        self.icon = habit.icon
+        self.completed_today = completed_today
+        self.streak = streak
+        self.completion_rate = completion_rate
+        self.goals = goals or []
+        self.longest_streak = longest_streak
+        self.completed_days = completed_days
+        self.total_days = total_days
+
+    def __repr__(self):
+        return f"HabitView('{self.name}', streak={self.streak})"
+
+
+def load_habit_views(habits, today=None):
+    """Build HabitViews for ``habits`` with two queries, regardless of habit count.
+
+    Today's status and weekly rates come from the history bits already loaded
+    with each habit; streaks and open goals are fetched in one query each.
+    """
+    if not habits:
+        return []
+
+    today = today or datetime.utcnow().date()
+    habit_ids = [habit.id for habit in habits]
+
+    # Persisted streaks
+    streaks = {
+        record.habit_id: record
+        for record in HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids))
+    }
+
+    # Open goals shown under each habit
+    goals = {}
+    for goal in HabitGoal.query.filter(
+        HabitGoal.habit_id.in_(habit_ids),
+        HabitGoal.is_achieved == False
+    ).order_by(HabitGoal.id):
+        goals.setdefault(goal.habit_id, []).append(plain(goal, *GOAL_FIELDS))
+
+    views = []
+    for habit in habits:
+        record = streaks.get(habit.id)
+        if record is None:
+            # Habits created before streaks were persisted get theirs built once
+            record = HabitStreak.for_habit(habit)
+        bits, start = habit.completion_history()
+        first = max(today - timedelta(days=6), habit.tracked_since)
+        window = (today - first).days + 1
+        views.append(HabitView(
+            habit,
+            completed_today=history.is_set(bits, start, today),
+            streak=record.current_streak,
+            completion_rate=int((history.count_between(bits, start, first, today) / window) * 100) if window > 0 else 0,
+            goals=goals.get(habit.id),
+            longest_streak=record.longest_streak,
+            completed_days=history.count_between(bits, start),
+            total_days=max((today - habit.tracked_since).days + 1, 0)
+        ))
+    return views
+
+
+class DashboardData:
+    """Everything the dashboard template renders, as plain picklable values
+    that can be cached across requests"""
+
+    def __init__(self, habits, user_stats, achievements, insights):
+        self.habits = habits
+        self.user_stats = user_stats
+        self.achievements = achievements
+        self.insights = insights
+        self.total_habits = len(habits)
+        self.completed_today = sum(1 for habit in habits if habit.completed_today)
+        self.longest_streak = max([habit.streak for habit in habits], default=0)
+        self.weekly_completion = int(sum(habit.completion_rate for habit in habits) / self.total_habits) if self.total_habits > 0 else 0
+
+    def template_context(self):
+        return {
+            'habits': self.habits,
+            'total_habits': self.total_habits,
+            'completed_today': self.completed_today,
+            'longest_streak': self.longest_streak,
+            'weekly_completion': self.weekly_completion,
+            'user_stats': self.user_stats,
+            'achievements': self.achievements,
+            'insights': self.insights,
+        }
+
+
+def load_dashboard(user_id, today=None):
+    """Load the dashboard for ``user_id`` in a fixed number of queries"""
+    habits = Habit.query.filter_by(user_id=user_id, is_active=True).all()
+    views = load_habit_views(habits, today)
+
+    user_stats = UserStats.query.filter_by(user_id=user_id).first()
+    if not user_stats:
+        user_stats = UserStats(user_id=user_id)
+        db.session.add(user_stats)
+    if db.session.new or db.session.dirty:
+        db.session.commit()
+
+    achievements = Achievement.query.filter_by(user_id=user_id).order_by(Achievement.unlocked_at.desc()).limit(5).all()
+    insights = AIInsight.query.filter_by(user_id=user_id).order_by(AIInsight.created_at.desc()).limit(4).all()
+
+    return DashboardData(
+        views,
+        plain(user_stats, *USER_STATS_FIELDS),
+        [plain(achievement, *ACHIEVEMENT_FIELDS) for achievement in achievements],
+        [plain(insight, *INSIGHT_FIELDS) for insight in insights]
+    )
+
+
+def load_insights(user_id, today=None):
+    """Template context for the insights page; chart data is fetched separately
+    from the history API"""
+    habits = Habit.query.filter_by(user_id=user_id).order_by(Habit.id).all()
+    views = load_habit_views(habits, today)
+    active = [view for habit, view in zip(habits, views) if habit.is_active]
+
+    return {
+        'habits': views,
+        'insights': AIInsight.query.filter_by(user_id=user_id).order_by(AIInsight.created_at.desc()).all(),
+        'user_stats': UserStats.query.filter_by(user_id=user_id).first(),
+        'achievements': Achievement.query.filter_by(user_id=user_id).all(),
+        'total_habits': len(active),
+        'longest_streak': max([view.longest_streak for view in views], default=0),
+        'weekly_completion': int(sum(view.completion_rate for view in active) / len(active)) if active else 0,
+    }
@@ -0,0 +1,74 @@
+"""Request-scoped memoization for derived model properties.
+
+Properties such as ``Habit.streak`` are read several times while rendering a
+single page. ``request_cached`` stores each value in ``flask.g`` keyed by the
+object's identity, so it is computed once per request. The cache is dropped
+whenever the session flushes or runs an ORM insert/update/delete, and
+``invalidate()`` drops a single object's entries after an in-memory change.
+"""
+from flask import g, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import functools
+
+
+def request_cached(func):
+    """Cache a zero-argument method's result for the current request"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        if not has_request_context():
+            return func(self)
+        cache = g.setdefault('_derived_cache', {})
+        counts = g.setdefault('_derived_counts', {'hits': 0, 'misses': 0})
+
+        # The cached entry keeps the object alive, so its id cannot be reused
+        entry = cache.get((id(self), name))
+        if entry is not None and entry[0] is self:
+            counts['hits'] += 1
+            return entry[1]
+
+        counts['misses'] += 1
+        value = func(self)
+        cache[(id(self), name)] = (self, value)
+        return value
+    return wrapper
+
+
+def invalidate(obj=None):
+    """Drop cached values of ``obj``, or of every object when ``None``"""
+    if not has_request_context():
+        return
+    cache = g.get('_derived_cache')
+    if not cache:
+        return
+    if obj is None:
+        cache.clear()
+    else:
+        for key in [key for key in cache if key[0] == id(obj)]:
+            del cache[key]
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_after_flush(session, flush_context):
+    invalidate()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_after_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        invalidate()
+
+
+def register_request_cache(app):
+    """Report per-request cache hits and misses when ``DERIVED_CACHE_STATS`` is on"""
+
+    @app.after_request
+    def report_derived_cache(response):
+        if not (app.debug or app.config.get('DERIVED_CACHE_STATS')):
+            return response
+        counts = g.get('_derived_counts', {'hits': 0, 'misses': 0})
+        response.headers['X-Derived-Cache'] = f"hits={counts['hits']}; misses={counts['misses']}"
+        current_app.logger.debug('Derived property cache: %(hits)d hits, %(misses)d misses', counts)
+        return response
@@ -0,0 +1,84 @@
+"""Prometheus text-format metrics at ``/metrics``.
+
+Each gunicorn worker serves its own numbers; scrape every worker or aggregate
+with the ``pid`` label. Scrapers send ``Authorization: Bearer <token>`` with
+``METRICS_TOKEN``; otherwise only users listed in ``ADMIN_EMAILS`` can read
+them, since they describe the app's SQL.
+"""
+from flask import Response, request, abort
+from flask_login import current_user
+from app import db
+from db_pool import MeteredQueuePool
+import hmac
+import os
+
+# Functions returning lists of exposition lines, appended to /metrics
+COLLECTORS = []
+
+
+def collector(func):
+    """Register ``func`` as a source of metric lines"""
+    COLLECTORS.append(func)
+    return func
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+@collector
+def pool_metrics():
+    """Connection pool gauges and checkout wait times per database"""
+    lines = [
+        '# HELP db_pool_size Configured connections kept in the pool.',
+        '# TYPE db_pool_size gauge',
+        '# HELP db_pool_checked_out Connections currently in use.',
+        '# TYPE db_pool_checked_out gauge',
+        '# HELP db_pool_overflow Connections open beyond the pool size.',
+        '# TYPE db_pool_overflow gauge',
+        '# HELP db_pool_checkout_timeouts_total Checkouts that gave up waiting for a connection.',
+        '# TYPE db_pool_checkout_timeouts_total counter',
+        '# HELP db_pool_checkout_wait_seconds Time spent waiting to check out a connection.',
+        '# TYPE db_pool_checkout_wait_seconds histogram',
+    ]
+    for bind, engine in db.engines.items():
+        if not isinstance(engine.pool, MeteredQueuePool):
+            continue
+        stats = engine.pool.stats()
+        labels = {'database': bind or 'default', 'pid': os.getpid()}
+        lines += [
+            f'db_pool_size{format_labels(**labels)} {stats["size"]}',
+            f'db_pool_checked_out{format_labels(**labels)} {stats["checked_out"]}',
+            f'db_pool_overflow{format_labels(**labels)} {stats["overflow"]}',
+            f'db_pool_checkout_timeouts_total{format_labels(**labels)} {stats["timeouts"]}',
+        ]
+        for bound, count in stats['wait_buckets']:
+            lines.append(f'db_pool_checkout_wait_seconds_bucket{format_labels(**labels, le=bound)} {count}')
+        lines += [
+            f'db_pool_checkout_wait_seconds_bucket{format_labels(**labels, le="+Inf")} {stats["checkouts"]}',
+            f'db_pool_checkout_wait_seconds_sum{format_labels(**labels)} {stats["wait_seconds"]:.6f}',
+            f'db_pool_checkout_wait_seconds_count{format_labels(**labels)} {stats["checkouts"]}',
+        ]
+    return lines
+
+
+def _is_admin(app):
+    return current_user.is_authenticated and current_user.email.lower() in app.config['ADMIN_EMAILS']
+
+
+def register_metrics(app):
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not (token and hmac.compare_digest(supplied, token)) and not _is_admin(app):
+            abort(401 if token else 404)
+        lines = []
+        for func in COLLECTORS:
+            lines += func()
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,33 @@
+"""Add per-habit completion history bits
+
+Revision ID: 3c9d5e7f1a2b
+Revises: b7e1c2d4a9f0
+Create Date: 2026-10-18 11:47:05.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d5e7f1a2b'
+down_revision = 'b7e1c2d4a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing habits get their bits built from HabitLog on first use,
+    # or all at once with `flask rebuild-streaks`
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('habit')}
+    with op.batch_alter_table('habit', schema=None) as batch_op:
+        if 'history_start' not in existing:
+            batch_op.add_column(sa.Column('history_start', sa.Date(), nullable=True))
+        if 'history_bits' not in existing:
+            batch_op.add_column(sa.Column('history_bits', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('habit', schema=None) as batch_op:
+        batch_op.drop_column('history_bits')
+        batch_op.drop_column('history_start')
@@ -0,0 +1,28 @@
+"""Add a per-user data version for snapshot cache invalidation
+
+Revision ID: 5d2e8a1f7c64
+Revises: 8f4a6b2c0d13
+Create Date: 2026-10-18 16:42:09.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8a1f7c64'
+down_revision = '8f4a6b2c0d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user')}
+    if 'data_version' not in existing:
+        with op.batch_alter_table('user', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
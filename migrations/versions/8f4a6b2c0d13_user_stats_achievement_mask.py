@@ -0,0 +1,45 @@
+"""Cache unlocked achievements as a bitmask on user stats
+
+Revision ID: 8f4a6b2c0d13
+Revises: 3c9d5e7f1a2b
+Create Date: 2026-10-18 14:03:27.551870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4a6b2c0d13'
+down_revision = '3c9d5e7f1a2b'
+branch_labels = None
+depends_on = None
+
+# Bits of the rules in achievements.RULES at the time of this migration
+RULE_BITS = {
+    'First Steps': 0,
+    'Week Warrior': 1,
+    'Month Master': 2,
+    'Streak Master': 3,
+    'Rising Star': 4,
+    'Habit Hero': 5,
+}
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user_stats')}
+    if 'achievement_mask' not in existing:
+        with op.batch_alter_table('user_stats', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('achievement_mask', sa.BigInteger(), nullable=False, server_default='0'))
+
+    # Seed the mask from the achievements users already have
+    for name, bit in RULE_BITS.items():
+        op.execute(sa.text(
+            "UPDATE user_stats SET achievement_mask = achievement_mask | :mask "
+            "WHERE user_id IN (SELECT user_id FROM achievement WHERE name = :name)"
+        ).bindparams(mask=1 << bit, name=name))
+
+
+def downgrade():
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.drop_column('achievement_mask')
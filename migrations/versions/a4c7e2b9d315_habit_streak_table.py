@@ -0,0 +1,83 @@
+"""Create the habit_streak table and seed it from the habit logs
+
+Revision ID: a4c7e2b9d315
+Revises: 5d2e8a1f7c64
+Create Date: 2026-10-19 09:21:44.107352
+
+"""
+from alembic import op
+from datetime import datetime
+import itertools
+import sqlalchemy as sa
+import history
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e2b9d315'
+down_revision = '5d2e8a1f7c64'
+branch_labels = None
+depends_on = None
+
+habit = sa.table(
+    'habit',
+    sa.column('id', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+    sa.column('history_start', sa.Date),
+    sa.column('history_bits', sa.LargeBinary),
+)
+habit_log = sa.table(
+    'habit_log',
+    sa.column('habit_id', sa.Integer),
+    sa.column('date', sa.Date),
+    sa.column('completed', sa.Boolean),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'habit_streak' in sa.inspect(bind).get_table_names():
+        return
+
+    habit_streak = op.create_table(
+        'habit_streak',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('habit_id', sa.Integer(), nullable=False),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('last_completed_date', sa.Date(), nullable=True),
+        sa.Column('longest_streak', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['habit_id'], ['habit.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('habit_id'),
+    )
+
+    # Same as `flask rebuild-streaks`: history bits and streaks from the completed logs
+    now = datetime.utcnow()
+    created = dict(bind.execute(sa.select(habit.c.id, habit.c.created_at)).all())
+    logs = bind.execute(
+        sa.select(habit_log.c.habit_id, habit_log.c.date)
+        .where(habit_log.c.completed == sa.true())
+        .order_by(habit_log.c.habit_id)
+        .execution_options(yield_per=10000)
+    )
+    grouped = ((habit_id, [row.date for row in rows])
+               for habit_id, rows in itertools.groupby(logs, key=lambda row: row.habit_id))
+
+    streaks = []
+    seen = set()
+    for habit_id, days in itertools.chain(grouped, ((habit_id, []) for habit_id in list(created))):
+        if habit_id in seen or habit_id not in created:
+            continue
+        seen.add(habit_id)
+        start = min(days + [(created[habit_id] or now).date()])
+        bits = history.from_dates(days, start)
+        bind.execute(habit.update().where(habit.c.id == habit_id).values(history_start=start, history_bits=bits))
+        current, longest, last = history.streaks(bits, start)
+        streaks.append({'habit_id': habit_id, 'current_streak': current, 'longest_streak': longest,
+                        'last_completed_date': last, 'updated_at': now})
+    if streaks:
+        op.bulk_insert(habit_streak, streaks)
+
+
+def downgrade():
+    op.drop_table('habit_streak')
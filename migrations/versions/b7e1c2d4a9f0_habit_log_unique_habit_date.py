@@ -0,0 +1,46 @@
+"""Deduplicate habit logs and add a unique (habit_id, date) index
+
+Revision ID: b7e1c2d4a9f0
+Revises: 
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1c2d4a9f0'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ix_habit_log_habit_id_date'
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {index['name'] for index in sa.inspect(bind).get_indexes('habit_log')}
+    if INDEX_NAME in existing:
+        return
+
+    # Keep the oldest row of each (habit_id, date) pair, completed if any
+    # of the duplicates was, and drop the rest
+    op.execute("""
+        UPDATE habit_log SET completed = true
+        WHERE id IN (
+            SELECT MIN(id) FROM habit_log
+            GROUP BY habit_id, date
+            HAVING COUNT(*) > 1 AND MAX(CASE WHEN completed THEN 1 ELSE 0 END) = 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM habit_log
+        WHERE id NOT IN (SELECT MIN(id) FROM habit_log GROUP BY habit_id, date)
+    """)
+
+    op.create_index(INDEX_NAME, 'habit_log', ['habit_id', 'date'], unique=True)
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='habit_log')
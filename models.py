@@ -1,7 +1,9 @@
 from app import db, login_manager
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import history
+from memo import request_cached, invalidate
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -15,6 +17,7 @@ class User(db.Model, UserMixin):
     avatar = db.Column(db.String(200))  # URL to avatar image
     timezone = db.Column(db.String(50), default='UTC')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    data_version = db.Column(db.Integer, default=0, nullable=False)  # bumped by every write to the user's data
     habits = db.relationship('Habit', backref='user', lazy=True, cascade='all, delete-orphan')
     insights = db.relationship('AIInsight', backref='user', lazy=True, cascade='all, delete-orphan')
     achievements = db.relationship('Achievement', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -28,6 +31,35 @@ class User(db.Model, UserMixin):
         from werkzeug.security import check_password_hash
         return check_password_hash(self.password_hash, password)
 
+    def local_now(self):
+        """Current time in the user's timezone (UTC when unset or unknown)"""
+        from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+        try:
+            zone = ZoneInfo(self.timezone or 'UTC')
+        except (ZoneInfoNotFoundError, ValueError):
+            zone = ZoneInfo('UTC')
+        return datetime.now(zone)
+
+    def local_today(self):
+        return self.local_now().date()
+
+    def seconds_until_midnight(self):
+        """Seconds until the user's local date changes"""
+        now = self.local_now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo)
+        return max(int((midnight - now).total_seconds()), 1)
+
+    @classmethod
+    def bump_data_version(cls, *user_ids):
+        """Mark the users' data as changed, invalidating their cached snapshots.
+
+        Runs in the caller's transaction; without ``user_ids`` every user is bumped.
+        """
+        stmt = db.update(cls).values(data_version=cls.data_version + 1)
+        if user_ids:
+            stmt = stmt.where(cls.id.in_(user_ids))
+        db.session.execute(stmt)
+
     def __repr__(self):
         return f"User('{self.username}', '{self.email}')"
 
@@ -43,62 +75,217 @@ class Habit(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    history_start = db.Column(db.Date)  # day of bit 0 in history_bits
+    history_bits = db.Column(db.LargeBinary)  # one bit per day, see history.py
     logs = db.relationship('HabitLog', backref='habit', lazy=True, cascade='all, delete-orphan')
     goals = db.relationship('HabitGoal', backref='habit', lazy=True, cascade='all, delete-orphan')
+    streak_record = db.relationship('HabitStreak', backref='habit', lazy=True, cascade='all, delete-orphan', uselist=False)
     
     @property
+    @request_cached
     def streak(self):
-        # Calculate current streak
-        logs = HabitLog.query.filter_by(habit_id=self.id, completed=True).order_by(HabitLog.date.desc()).all()
-        if not logs:
-            return 0
-            
-        streak = 1
-        for i in range(len(logs) - 1):
-            if (logs[i].date - logs[i+1].date).days == 1:
-                streak += 1
-            else:
-                break
-                
-        return streak
+        # Current streak is maintained incrementally in HabitStreak
+        return HabitStreak.for_habit(self).current_streak
     
     @property
+    @request_cached
     def completion_rate(self):
-        # Calculate weekly completion rate
+        # Share of the last 7 days (or of the days since tracking began) completed
         today = datetime.utcnow().date()
-        week_ago = today - datetime.timedelta(days=7)
-        
-        logs = HabitLog.query.filter(
-            HabitLog.habit_id == self.id,
-            HabitLog.date >= week_ago,
-            HabitLog.date <= today
-        ).all()
-        
-        if not logs:
+        bits, start = self.completion_history()
+        first = max(today - timedelta(days=6), self.tracked_since)
+        if first > today:
             return 0
-            
-        completed = sum(1 for log in logs if log.completed)
-        return int((completed / len(logs)) * 100)
+        completed = history.count_between(bits, start, first, today)
+        return int((completed / ((today - first).days + 1)) * 100)
     
     @property
+    @request_cached
     def completed_today(self):
-        today = datetime.utcnow().date()
-        log = HabitLog.query.filter_by(habit_id=self.id, date=today).first()
-        return log.completed if log else False
+        bits, start = self.completion_history()
+        return history.is_set(bits, start, datetime.utcnow().date())
+    
+    @property
+    def tracked_since(self):
+        created = (self.created_at or datetime.utcnow()).date()
+        return min(created, self.history_start) if self.history_start else created
+    
+    def completion_history(self):
+        """Return ``(bits, start)``, building it from the logs on first use"""
+        if self.history_bits is None:
+            self.rebuild_history()
+        return self.history_bits, self.history_start
+    
+    def set_completed(self, day, completed):
+        """Record a completion change for ``day`` in the history bits"""
+        bits, start = self.completion_history()
+        self.history_bits, self.history_start = history.set_day(bits, start, day, completed)
+        invalidate(self)
+    
+    def rebuild_history(self):
+        """Recompute the history bits from the habit's completed logs"""
+        dates = []
+        if self.id is not None:
+            dates = [row.date for row in db.session.query(HabitLog.date).filter(
+                HabitLog.habit_id == self.id,
+                HabitLog.completed == True
+            )]
+        start = min(dates + [(self.created_at or datetime.utcnow()).date()])
+        self.history_start = start
+        self.history_bits = history.from_dates(dates, start)
+        invalidate(self)
     
     def __repr__(self):
         return f"Habit('{self.name}', '{self.category}')"
 
 class HabitLog(db.Model):
+    # One log per habit and day; also the index behind every hot lookup
+    __table_args__ = (
+        db.Index('ix_habit_log_habit_id_date', 'habit_id', 'date', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), nullable=False)
     date = db.Column(db.Date, default=datetime.utcnow().date)
     completed = db.Column(db.Boolean, default=False)
     notes = db.Column(db.Text)
     
+    @classmethod
+    def toggle(cls, habit_id, day):
+        """Flip the completion of ``habit_id`` on ``day`` and return the new state.
+
+        On SQLite and Postgres this is a single INSERT .. ON CONFLICT DO UPDATE,
+        so concurrent toggles can never create duplicate rows.
+        """
+        dialect = db.session.get_bind(mapper=cls).dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            log = cls.query.filter_by(habit_id=habit_id, date=day).first()
+            if log:
+                log.completed = not log.completed
+            else:
+                log = cls(habit_id=habit_id, date=day, completed=True)
+                db.session.add(log)
+            db.session.flush()
+            return log.completed
+
+        stmt = insert(cls).values(habit_id=habit_id, date=day, completed=True)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['habit_id', 'date'],
+            set_={'completed': db.case((cls.completed == True, False), else_=True)}
+        ).returning(cls.completed)
+        return bool(db.session.execute(stmt).scalar_one())
+    
+    @classmethod
+    def insert_missing(cls, rows):
+        """Bulk-insert ``{'habit_id', 'date', 'completed'}`` rows, skipping any
+        ``(habit_id, date)`` pair that already exists. Returns how many were inserted.
+        """
+        if not rows:
+            return 0
+        dialect = db.session.get_bind(mapper=cls).dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            existing = set(db.session.query(cls.habit_id, cls.date).filter(
+                cls.habit_id.in_({row['habit_id'] for row in rows}),
+                cls.date.between(min(row['date'] for row in rows), max(row['date'] for row in rows))
+            ))
+            rows = [row for row in rows if (row['habit_id'], row['date']) not in existing]
+            if rows:
+                db.session.execute(db.insert(cls), rows)
+            return len(rows)
+        
+        stmt = insert(cls).on_conflict_do_nothing(index_elements=['habit_id', 'date']).returning(cls.id)
+        return len(db.session.execute(stmt, rows).all())
+    
     def __repr__(self):
         return f"HabitLog(Habit ID: {self.habit_id}, Date: {self.date}, Completed: {self.completed})"
 
+class HabitStreak(db.Model):
+    """Persisted streak state for a habit, updated on every toggle.
+
+    ``current_streak`` is the length of the run of completed days ending at
+    ``last_completed_date``; ``longest_streak`` is the longest such run.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), unique=True, nullable=False)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_completed_date = db.Column(db.Date)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def for_habit(cls, habit):
+        """Return the habit's streak record, building it from the logs if missing"""
+        if habit.streak_record is None:
+            record = cls(current_streak=0, longest_streak=0)
+            habit.streak_record = record
+            if habit.id is not None:
+                record.habit_id = habit.id
+                record.rebuild()
+        return habit.streak_record
+
+    def apply(self, day, completed):
+        """Apply a single day's completion change.
+
+        Toggling today, yesterday-to-today extensions and un-toggling inside
+        the current run are handled arithmetically. Edits that can merge or
+        split older runs fall back to a rebuild from the history bits.
+        """
+        if self.habit is not None:
+            invalidate(self.habit)
+        current = self.current_streak or 0
+        longest = self.longest_streak or 0
+        last = self.last_completed_date
+        run_start = last - timedelta(days=current - 1) if last and current else None
+
+        if completed:
+            if last is None or current == 0:
+                self.current_streak, self.last_completed_date = 1, day
+            elif day == last + timedelta(days=1):
+                self.current_streak, self.last_completed_date = current + 1, day
+            elif day > last:
+                self.current_streak, self.last_completed_date = 1, day
+            elif day >= run_start:
+                return  # already part of the current run
+            else:
+                # Backfilled day before the current run may join older runs
+                return self.rebuild()
+            self.longest_streak = max(longest, self.current_streak)
+        else:
+            if last is None or day > last:
+                return
+            if day < run_start or longest <= current or (day == last and current == 1):
+                # Older history changed, the longest run shrinks, or the
+                # current run disappears and the previous one takes over
+                return self.rebuild()
+            # Removing a day keeps only the part of the run after it
+            self.current_streak = (last - day).days if day < last else current - 1
+            if day == last:
+                self.last_completed_date = last - timedelta(days=1)
+        self.updated_at = datetime.utcnow()
+
+    def rebuild(self):
+        """Recompute the streak state from the habit's completion history"""
+        habit = self.habit or Habit.query.get(self.habit_id)
+        invalidate(habit)
+        bits, start = habit.completion_history()
+        current, longest, last = history.streaks(bits, start)
+
+        self.current_streak = current
+        self.longest_streak = longest
+        self.last_completed_date = last
+        self.updated_at = datetime.utcnow()
+
+    def __repr__(self):
+        return f"HabitStreak(Habit ID: {self.habit_id}, Current: {self.current_streak}, Longest: {self.longest_streak})"
+
 class HabitGoal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), nullable=False)
@@ -139,13 +326,16 @@ class UserStats(db.Model):
     level = db.Column(db.Integer, default=1)
     longest_streak = db.Column(db.Integer, default=0)
     total_habits_completed = db.Column(db.Integer, default=0)
+    achievement_mask = db.Column(db.BigInteger, default=0, nullable=False)  # bits of unlocked rules, see achievements.py
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     
     @property
+    @request_cached
     def next_level_points(self):
         return self.level * 100
     
     @property
+    @request_cached
     def progress_to_next_level(self):
         if self.next_level_points == 0:
             return 0
@@ -164,4 +354,31 @@ class AIInsight(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f"AIInsight('{self.type}', '{self.title}')"
\ No newline at end of file
+        return f"AIInsight('{self.type}', '{self.title}')"
+
+class Job(db.Model):
+    """Background job, kept in the local queue database (the ``jobs`` bind)"""
+    __bind_key__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, index=True)  # lives in the main database, so no foreign key
+    payload = db.Column(db.Text, default='{}')  # JSON keyword arguments for the handler
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, done, failed
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return f"Job({self.id}, '{self.kind}', '{self.status}')"
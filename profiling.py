@@ -0,0 +1,254 @@
+"""On-demand per-request profiling.
+
+A request is profiled when a user listed in ``ADMIN_EMAILS`` sends an
+``X-Profile: 1`` header or a ``?profile=1`` query parameter, or when it is
+picked at random at ``PROFILE_SAMPLE_RATE`` (optionally only for
+``PROFILE_ENDPOINTS`` and ``PROFILE_USER_IDS``, to catch one user's slow
+dashboard). The ``sample`` mode reads the request thread's stack every
+``PROFILE_INTERVAL_MS`` and writes collapsed stacks (``<id>.folded``, the
+input of flamegraph.pl and speedscope); the ``cprofile`` mode writes a pstats
+dump (``<id>.prof``). Both also write ``<id>.json`` with the request and
+every SQL statement it ran and its timing. Files go to ``PROFILE_DIR``; the
+oldest are removed beyond ``PROFILE_MAX_FILES`` profiles. The profile id is
+returned in an ``X-Profile-Id`` header; ``flask profiles list`` and
+``flask profiles show <id>`` read them back.
+"""
+from flask import g, request, has_request_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+from datetime import datetime
+from sql_metrics import statement_shape
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+MODES = ('sample', 'cprofile')
+MAX_STATEMENTS = 500
+
+
+def profile_dir(app):
+    return app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+
+class StackSampler:
+    """Sample one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format: ``root;...;leaf count`` per line"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('_profile') is not None:
+        conn.info.setdefault('_profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_profile_start')
+    if not starts or not has_request_context():
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    profile = g.get('_profile')
+    if profile is not None and len(profile['statements']) < MAX_STATEMENTS:
+        offset = time.perf_counter() - profile['started'] - elapsed
+        profile['statements'].append({
+            'offset_ms': round(offset * 1000, 3), 'ms': round(elapsed * 1000, 3), 'statement': statement
+        })
+
+
+def _requested(app):
+    """Whether an admin asked for this request to be profiled"""
+    if request.headers.get('X-Profile') != '1' and request.args.get('profile') != '1':
+        return False
+    return current_user.is_authenticated and current_user.email.lower() in app.config['ADMIN_EMAILS']
+
+
+def _sampled(app):
+    if request.endpoint in (None, 'static') or random.random() >= app.config['PROFILE_SAMPLE_RATE']:
+        return False
+    endpoints, user_ids = app.config['PROFILE_ENDPOINTS'], app.config['PROFILE_USER_IDS']
+    if endpoints and request.endpoint not in endpoints:
+        return False
+    return not user_ids or (current_user.is_authenticated and current_user.id in user_ids)
+
+
+def _prune(directory, keep):
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in profiles[:max(len(profiles) - keep, 0)]:
+        profile_id = name[:-len('.json')]
+        for extension in ('.json', '.folded', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+def _finish(app, profile, status):
+    wall = time.perf_counter() - profile['started']
+    cpu = time.thread_time() - profile['cpu_started']
+    if profile['sampler']:
+        profile['sampler'].stop()
+    else:
+        profile['profiler'].disable()
+
+    directory = profile_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, profile['id'])
+    statements = profile['statements']
+    summary = {
+        'id': profile['id'],
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'trigger': profile['trigger'],
+        'mode': profile['mode'],
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': status,
+        'user_id': current_user.id if current_user.is_authenticated else None,
+        'wall_ms': round(wall * 1000, 3),
+        'cpu_ms': round(cpu * 1000, 3),
+        'sql_count': len(statements),
+        'sql_ms': round(sum(statement['ms'] for statement in statements), 3),
+        'statements': statements,
+    }
+    if profile['sampler']:
+        summary['samples'] = sum(profile['sampler'].stacks.values())
+        summary['interval_ms'] = app.config['PROFILE_INTERVAL_MS']
+        with open(path + '.folded', 'w') as folded:
+            folded.write(profile['sampler'].collapsed())
+    else:
+        profile['profiler'].dump_stats(path + '.prof')
+    with open(path + '.json', 'w') as output:
+        json.dump(summary, output, indent=1)
+    _prune(directory, app.config['PROFILE_MAX_FILES'])
+
+
+def register_profiling(app):
+    """Profile admin-requested and sampled requests"""
+    if app.config['PROFILE_MODE'] not in MODES:
+        raise ValueError(f"PROFILE_MODE must be one of {', '.join(MODES)}")
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        if _requested(app):
+            trigger = 'admin'
+        elif app.config['PROFILE_SAMPLE_RATE'] and _sampled(app):
+            trigger = 'sample'
+        else:
+            return
+        mode = app.config['PROFILE_MODE']
+        profile = g._profile = {
+            # Sortable by time, unique across workers
+            'id': f"{datetime.utcnow():%Y%m%dT%H%M%S}-{request.endpoint}-{uuid.uuid4().hex[:8]}",
+            'trigger': trigger, 'mode': mode, 'statements': [], 'sampler': None, 'profiler': None,
+            'started': time.perf_counter(), 'cpu_started': time.thread_time(),
+        }
+        if mode == 'cprofile':
+            profile['profiler'] = cProfile.Profile()
+            profile['profiler'].enable()
+        else:
+            profile['sampler'] = StackSampler(threading.get_ident(), app.config['PROFILE_INTERVAL_MS'] / 1000)
+            profile['sampler'].start()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            try:
+                _finish(app, profile, response.status_code)
+                response.headers['X-Profile-Id'] = profile['id']
+            except OSError:
+                app.logger.exception('Could not write profile %s', profile['id'])
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # The view raised, so after_request never ran
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            try:
+                _finish(app, profile, 500)
+            except OSError:
+                app.logger.exception('Could not write profile %s', profile['id'])
+
+
+def load(app, profile_id):
+    """The summary of ``profile_id`` (a unique prefix is enough)"""
+    directory = profile_dir(app)
+    matches = [name for name in os.listdir(directory) if name.startswith(profile_id) and name.endswith('.json')]
+    if len(matches) != 1:
+        raise LookupError(f'{len(matches)} profiles match {profile_id!r}')
+    with open(os.path.join(directory, matches[0])) as summary:
+        return json.load(summary)
+
+
+def summaries(app):
+    """Summaries of the stored profiles, newest first"""
+    directory = profile_dir(app)
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as summary:
+                result.append(json.load(summary))
+    return result
+
+
+def top_frames(folded_path, limit):
+    """``(self, total)`` sample counters per frame from a collapsed-stack file"""
+    own, total = Counter(), Counter()
+    with open(folded_path) as folded:
+        for line in folded:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            frames = stack.split(';')
+            own[frames[-1]] += int(count)
+            for frame in set(frames):
+                total[frame] += int(count)
+    return own.most_common(limit), total.most_common(limit)
+
+
+def top_statements(statements, limit):
+    """Statement shapes by total time: ``[(shape, count, ms)]``"""
+    grouped = {}
+    for statement in statements:
+        shape = statement_shape(statement['statement'])
+        count, ms = grouped.get(shape, (0, 0.0))
+        grouped[shape] = (count + 1, ms + statement['ms'])
+    return sorted(((shape, count, ms) for shape, (count, ms) in grouped.items()), key=lambda item: -item[2])[:limit]
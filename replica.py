@@ -0,0 +1,78 @@
+"""Optional read replica for read-only views.
+
+When ``DATABASE_REPLICA_URL`` is set, views decorated with ``use_replica`` run
+their SELECTs against the ``replica`` bind. Flushes, INSERT/UPDATE/DELETE
+statements and models on other binds keep using their own engine. A request
+that writes to the primary reads from the primary for the rest of the request
+and pins the user's session to the primary for ``REPLICA_PIN_SECONDS``, so
+users always read their own writes even while the replica lags behind.
+
+For local testing point the replica at a second SQLite file and copy the
+primary into it with ``flask sync-replica`` (``--interval`` keeps it syncing).
+"""
+from flask import g, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+import functools
+import time
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends reads of replica-enabled requests to the replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if (bind is None and not self._flushing and getattr(clause, 'is_select', False)
+                and _reading_replica()):
+            engines = self._db.engines
+            if engine is engines.get(None) and REPLICA_BIND in engines:
+                return engines[REPLICA_BIND]
+        return engine
+
+
+def _reading_replica():
+    return has_request_context() and g.get('_use_replica', False)
+
+
+def use_replica(view):
+    """Serve the view's reads from the replica unless the user recently wrote"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g._use_replica = (
+            REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {})
+            and session.get('_primary_until', 0) < time.time()
+        )
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _wrote_primary():
+    # The rest of the request reads from the primary too: objects expired by
+    # the commit must not reload from a replica that lacks the new rows
+    g._wrote_primary = True
+    g._use_replica = False
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flag_flush(session, flush_context):
+    if has_request_context():
+        _wrote_primary()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _flag_write(orm_execute_state):
+    if has_request_context() and not orm_execute_state.is_select:
+        _wrote_primary()
+
+
+def register_replica(app):
+    """Pin sessions that wrote to the primary for ``REPLICA_PIN_SECONDS``"""
+
+    @app.after_request
+    def pin_to_primary(response):
+        if g.get('_wrote_primary') and REPLICA_BIND in app.config.get('SQLALCHEMY_BINDS', {}):
+            session['_primary_until'] = time.time() + app.config['REPLICA_PIN_SECONDS']
+        return response
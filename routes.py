@@ -1,13 +1,23 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, current_app, session, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import User, Habit, HabitLog, AIInsight, UserStats, Achievement, HabitGoal
+from models import User, Habit, HabitLog, HabitStreak, AIInsight, UserStats, HabitGoal, Job
 from app import db
+from loaders import load_dashboard, load_insights
+from achievements import check_achievements
+from jobs import enqueue, ensure_queue, job_handler
+from replica import use_replica
+from cache import get_cache
+import history
+import analytics
+import importer
+import exporter
+from sqlalchemy import update, case, func
 from datetime import datetime, timedelta
+import functools
+import hashlib
+import os
 import random
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LinearRegression
 
 def register_routes(app):
     
@@ -18,38 +28,18 @@ def register_routes(app):
         return render_template('index.html')
     
     @app.route('/dashboard')
+    @use_replica
     @login_required
+    @conditional_page
     def dashboard():
-        habits = Habit.query.filter_by(user_id=current_user.id, is_active=True).all()
-        
-        # Calculate stats
-        total_habits = len(habits)
-        completed_today = sum(1 for habit in habits if habit.completed_today)
-        longest_streak = max([habit.streak for habit in habits], default=0)
-        weekly_completion = int(sum(habit.completion_rate for habit in habits) / total_habits) if total_habits > 0 else 0
-        
-        # Get user stats
-        user_stats = UserStats.query.filter_by(user_id=current_user.id).first()
-        if not user_stats:
-            user_stats = UserStats(user_id=current_user.id)
-            db.session.add(user_stats)
-            db.session.commit()
-        
-        # Get recent achievements
-        achievements = Achievement.query.filter_by(user_id=current_user.id).order_by(Achievement.unlocked_at.desc()).limit(5).all()
-        
-        # Get AI insights
-        insights = AIInsight.query.filter_by(user_id=current_user.id).order_by(AIInsight.created_at.desc()).limit(4).all()
-        
-        return render_template('dashboard.html', 
-                              habits=habits, 
-                              total_habits=total_habits,
-                              completed_today=completed_today,
-                              longest_streak=longest_streak,
-                              weekly_completion=weekly_completion,
-                              user_stats=user_stats,
-                              achievements=achievements,
-                              insights=insights)
+        # Snapshots are keyed by data version, so any write makes them unreachable
+        cache = get_cache()
+        key = snapshot_key('dashboard', current_user)
+        data = cache.get(key)
+        if data is None:
+            data = load_dashboard(current_user.id)
+            cache.set(key, data, snapshot_ttl(current_user))
+        return render_template('dashboard.html', **data.template_context())
     
     @app.route('/register', methods=['GET', 'POST'])
     def register():
@@ -148,12 +138,17 @@ def register_routes(app):
                 color=color,
                 icon=icon,
                 frequency=frequency,
-                user_id=current_user.id
+                user_id=current_user.id,
+                history_start=datetime.utcnow().date(),
+                history_bits=b''
             )
             
             db.session.add(new_habit)
             db.session.commit()
             
+            # Start with an empty streak record
+            db.session.add(HabitStreak(habit_id=new_habit.id))
+            
             # Create initial goal for the habit
             initial_goal = HabitGoal(
                 habit_id=new_habit.id,
@@ -163,10 +158,9 @@ def register_routes(app):
                 target_date=datetime.utcnow().date() + timedelta(days=7)
             )
             db.session.add(initial_goal)
+            User.bump_data_version(current_user.id)
             db.session.commit()
-            
-            # Update user stats
-            update_user_stats(current_user.id)
+            analytics.invalidate(current_user.id)
             
             flash(f'Habit "{name}" created successfully! 🎉', 'success')
             return redirect(url_for('dashboard'))
@@ -183,28 +177,20 @@ def register_routes(app):
             flash('Unauthorized access', 'danger')
             return redirect(url_for('dashboard'))
             
-        today = datetime.utcnow().date()
-        log = HabitLog.query.filter_by(habit_id=habit.id, date=today).first()
-        
-        if log:
-            log.completed = not log.completed
-        else:
-            log = HabitLog(habit_id=habit.id, date=today, completed=True)
-            db.session.add(log)
-            
-        db.session.commit()
+        toggle_habit_completion(habit)
         
-        # Update user stats and check achievements
-        update_user_stats(current_user.id)
-        
-        # Update habit goals
-        update_habit_goals(habit.id)
+        return redirect(url_for('dashboard'))
+    
+    @app.route('/api/habits/<int:habit_id>/toggle', methods=['POST'])
+    @login_required
+    def api_toggle_habit(habit_id):
+        habit = db.session.get(Habit, habit_id)
         
-        # Generate new insights occasionally
-        if random.random() < 0.3:  # 30% chance
-            generate_new_insight(current_user.id)
+        # Ensure habit belongs to current user
+        if not habit or habit.user_id != current_user.id:
+            return jsonify({'error': 'Habit not found'}), 404
         
-        return redirect(url_for('dashboard'))
+        return jsonify(toggle_habit_completion(habit))
     
     @app.route('/habits/<int:habit_id>/delete', methods=['POST'])
     @login_required
@@ -215,140 +201,415 @@ def register_routes(app):
         if habit.user_id != current_user.id:
             flash('Unauthorized access', 'danger')
             return redirect(url_for('dashboard'))
+        
+        # The habit's streak no longer counts towards the user's stats
+        habit = lock_habit(habit)
+        if habit.is_active:
+            apply_stats_delta(current_user.id, -HabitStreak.for_habit(habit).current_streak)
             
         db.session.delete(habit)
         db.session.commit()
+        analytics.invalidate(current_user.id)
         
         flash(f'Habit "{habit.name}" deleted successfully', 'success')
         return redirect(url_for('dashboard'))
     
     @app.route('/insights')
+    @use_replica
     @login_required
+    @conditional_page
     def insights():
-        habits = Habit.query.filter_by(user_id=current_user.id).all()
-        insights = AIInsight.query.filter_by(user_id=current_user.id).order_by(AIInsight.created_at.desc()).all()
+        return render_template('insights.html', **load_insights(current_user.id))
+    
+    @app.route('/api/history')
+    @use_replica
+    @login_required
+    def api_history():
+        """Completion history per habit, aggregated server-side.
+        
+        Query parameters: ``start``/``end`` (YYYY-MM-DD, default the last 90
+        days), ``habit_id`` (repeatable), ``resolution`` (day, week or month),
+        ``limit`` habits per page and ``cursor`` from the previous page.
+        """
+        try:
+            end = parse_date(request.args.get('end')) or datetime.utcnow().date()
+            start = parse_date(request.args.get('start')) or end - timedelta(days=89)
+            cursor = request.args.get('cursor', 0, type=int)
+            limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        except ValueError:
+            return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+        
+        resolution = request.args.get('resolution', 'day')
+        if resolution not in history.RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of {', '.join(history.RESOLUTIONS)}"}), 400
+        if start > end:
+            return jsonify({'error': 'start must not be after end'}), 400
+        if (end - start).days >= MAX_HISTORY_DAYS[resolution]:
+            return jsonify({'error': f'At most {MAX_HISTORY_DAYS[resolution]} days per request at {resolution} resolution'}), 400
         
-        # Generate visualization data
-        habit_data = []
-        for habit in habits:
-            logs = HabitLog.query.filter_by(habit_id=habit.id).order_by(HabitLog.date).all()
-            dates = [log.date.strftime('%Y-%m-%d') for log in logs]
-            completions = [1 if log.completed else 0 for log in logs]
-            habit_data.append({
+        query = Habit.query.filter(Habit.user_id == current_user.id, Habit.id > cursor)
+        habit_ids = request.args.getlist('habit_id', type=int)
+        if habit_ids:
+            query = query.filter(Habit.id.in_(habit_ids))
+        habits = query.order_by(Habit.id).limit(limit + 1).all()
+        
+        page = []
+        for habit in habits[:limit]:
+            bits, history_start = habit.completion_history()
+            first = max(start, habit.tracked_since)
+            page.append({
+                'id': habit.id,
                 'name': habit.name,
                 'category': habit.category,
-                'dates': dates,
-                'completions': completions
+                'color': habit.color,
+                'periods': [
+                    {'start': period.isoformat(), 'completed': completed, 'days': days}
+                    for period, completed, days in history.aggregate(bits, history_start, first, end, resolution)
+                ]
             })
         
-        return render_template('insights.html', habits=habits, insights=insights, habit_data=habit_data)
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'resolution': resolution,
+            'habits': page,
+            'next_cursor': habits[limit - 1].id if len(habits) > limit else None
+        })
+    
+    @app.route('/api/import', methods=['POST'])
+    @login_required
+    def api_import():
+        """Import habit logs from an uploaded CSV or JSON Lines ``file``.
+        
+        Optional form fields: ``format`` (csv or jsonl, otherwise taken from
+        the file name) and ``create_habits`` to create habits that don't exist.
+        """
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'Upload the logs as a "file" form field'}), 400
+        
+        try:
+            fmt = importer.detect_format(upload.filename, request.form.get('format'))
+            summary = importer.import_logs(
+                current_user.id,
+                importer.text_stream(upload.stream),
+                fmt=fmt,
+                create_habits=bool(request.form.get('create_habits'))
+            )
+        except importer.ImportFileError as error:
+            # Batches committed before the error stay imported; report them
+            return jsonify({'error': str(error), 'summary': error.summary}), 400
+        
+        return jsonify(summary)
+    
+    @app.route('/api/export')
+    @use_replica
+    @login_required
+    def api_export():
+        """Download the user's data as a streamed file.
+        
+        Query parameters: ``format`` (csv or jsonl, default csv) and ``type``
+        (habits, logs, goals, achievements, or all for jsonl; default logs for
+        csv and all for jsonl).
+        """
+        fmt = request.args.get('format', 'csv')
+        if fmt not in exporter.FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(exporter.FORMATS)}"}), 400
+        try:
+            kinds = exporter.parse_types(request.args.get('type'), fmt)
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        
+        filename = f"habits-{'-'.join(kinds) if len(kinds) == 1 else 'export'}-{datetime.utcnow():%Y%m%d}.{fmt}"
+        return Response(
+            stream_with_context(exporter.stream(fmt, kinds, current_user.id)),
+            mimetype=exporter.CONTENT_TYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
     
     @app.route('/api/generate-insight', methods=['POST'])
     @login_required
     def api_generate_insight():
+        if request.args.get('async'):
+            job = enqueue('generate_insight', user_id=current_user.id)
+            return jsonify({
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': url_for('api_job_status', job_id=job.id)
+            }), 202
+        
         insight = generate_new_insight(current_user.id)
-        return jsonify({
-            'id': insight.id,
-            'type': insight.type,
-            'title': insight.title,
-            'message': insight.message,
-            'confidence': insight.confidence
-        })
+        return jsonify(insight_to_dict(insight))
+    
+    @app.route('/api/jobs/<int:job_id>')
+    @login_required
+    def api_job_status(job_id):
+        ensure_queue()
+        job = db.session.get(Job, job_id)
+        if not job or job.user_id != current_user.id:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job.to_dict())
+
+# Background jobs
+@job_handler('generate_insight')
+def generate_insight_job(user_id):
+    return insight_to_dict(generate_new_insight(user_id))
 
 # Helper functions
-def update_user_stats(user_id):
-    """Update user statistics and check for achievements"""
-    user = User.query.get(user_id)
-    if not user:
-        return
+# Longest date range a single history request may cover, per resolution
+MAX_HISTORY_DAYS = {'day': 366, 'week': 5 * 366, 'month': 20 * 366}
+
+def parse_date(value):
+    """Parse an optional YYYY-MM-DD query parameter"""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def snapshot_key(page, user):
+    """Cache key of a page snapshot, changing with every write and day boundary.
+
+    Pages are computed for the UTC day; the user's local date is part of the
+    key too so snapshots also roll over at the user's midnight.
+    """
+    return f'{page}:{user.id}:v{user.data_version}:{datetime.utcnow().date()}:{user.local_today()}'
+
+def snapshot_ttl(user):
+    """Seconds until the earlier of the UTC and the user's local midnight,
+    capped at ``SNAPSHOT_CACHE_TTL``"""
+    now = datetime.utcnow()
+    utc_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(min(int((utc_midnight - now).total_seconds()), user.seconds_until_midnight(),
+                   current_app.config['SNAPSHOT_CACHE_TTL']), 1)
+
+def template_release():
+    """Fingerprint of the deployed templates, so a deploy changes every ETag"""
+    if 'TEMPLATE_RELEASE' not in current_app.config:
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        stamps = sorted((name, os.stat(os.path.join(folder, name)).st_mtime_ns) for name in os.listdir(folder))
+        current_app.config['TEMPLATE_RELEASE'] = hashlib.sha1(repr(stamps).encode()).hexdigest()[:8]
+    return current_app.config['TEMPLATE_RELEASE']
+
+def conditional_page(view):
+    """Answer ``If-None-Match`` with 304 while the user's data version and day
+    are unchanged, before the view runs any queries"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Flashed messages are shown once, so a page carrying them must not be reused
+        if session.get('_flashes'):
+            return view(*args, **kwargs)
+        
+        key = f'{snapshot_key(request.endpoint, current_user)}:{template_release()}'
+        etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
+
+def toggle_habit_completion(habit, day=None):
+    """Toggle ``habit`` on ``day`` (today by default) and apply every side effect.
+
+    Returns the habit's new state, its affected goals and the user's level and
+    points, as served by the JSON toggle API.
+    """
+    day = day or datetime.utcnow().date()
+    habit = lock_habit(habit)
+    # A missing streak record is built from the history, so do it before the change
+    streak = HabitStreak.for_habit(habit)
+    previous_streak = streak.current_streak
+    completed = HabitLog.toggle(habit.id, day)
+    
+    # Keep the history bits and persisted streak in step with the log change
+    habit.set_completed(day, completed)
+    streak.apply(day, completed)
+    
+    # Update user stats and check achievements
+    user_stats = apply_stats_delta(habit.user_id, streak.current_streak - previous_streak, streak.current_streak)
+    
+    # Update habit goals
+    goals = apply_goal_delta(habit.id, day, 1 if completed else -1)
+    
+    # Build the result before committing expires the objects it reads
+    result = {
+        'habit_id': habit.id,
+        'date': day.isoformat(),
+        'completed': completed,
+        'streak': streak.current_streak,
+        'longest_streak': streak.longest_streak,
+        'completion_rate': habit.completion_rate,
+        'goals': [{
+            'id': goal.id,
+            'title': goal.title,
+            'current_value': goal.current_value,
+            'target_value': goal.target_value,
+            'progress_percentage': goal.progress_percentage,
+            'is_achieved': goal.is_achieved
+        } for goal in goals],
+        'user': {
+            'level': user_stats.level,
+            'total_points': user_stats.total_points,
+            'longest_streak': user_stats.longest_streak,
+            'progress_to_next_level': user_stats.progress_to_next_level
+        }
+    }
+    db.session.commit()
+    analytics.invalidate(habit.user_id)
+    
+    # Generate new insights occasionally, off the request path
+    if random.random() < 0.3:  # 30% chance
+        enqueue('generate_insight', user_id=habit.user_id)
+    
+    return result
+
+def lock_habit(habit):
+    """Lock ``habit`` for the rest of the transaction and reload it and its streak.
+
+    Toggles read the history bits, streak and stats they then change, so two
+    toggles of one user must not interleave. Bumping the data version writes
+    the user's row first: on SQLite that takes the database write lock, on
+    Postgres a row lock, and the habit row is also locked ``FOR UPDATE``.
+    Everything loaded before the lock may be stale and is read again; a habit
+    deleted in the meantime is a 404.
+    """
+    habit_id = habit.id
+    User.bump_data_version(habit.user_id)
+    db.session.expire(habit)
+    habit = Habit.query.filter_by(id=habit_id).with_for_update().first_or_404()
+    HabitStreak.query.filter_by(habit_id=habit_id).populate_existing().first()
+    return habit
+
+def apply_stats_delta(user_id, completed_delta, streak=0):
+    """Apply the change caused by a single event to the user's stats in one UPDATE.
+
+    ``completed_delta`` is the change in the sum of the user's current streaks
+    (10 points per day) and ``streak`` the affected habit's new current streak.
+    Returns the updated stats after checking for achievements.
+    """
+    points_delta = completed_delta * 10
+    values = {
+        'total_habits_completed': UserStats.total_habits_completed + completed_delta,
+        'total_points': UserStats.total_points + points_delta,
+        'level': (UserStats.total_points + points_delta) // 100 + 1,
+        'longest_streak': case((UserStats.longest_streak < streak, streak), else_=UserStats.longest_streak),
+        'last_updated': datetime.utcnow(),
+    }
+    stmt = update(UserStats).where(UserStats.user_id == user_id).values(**values)
+    
+    if db.session.get_bind(mapper=UserStats).dialect.update_returning:
+        user_stats = db.session.execute(stmt.returning(UserStats)).scalar_one_or_none()
+    else:
+        db.session.execute(stmt)
+        user_stats = UserStats.query.filter_by(user_id=user_id).populate_existing().first()
     
-    # Get or create user stats
+    if user_stats is None:
+        # First event for this user: start from a full computation instead
+        return recompute_user_stats(user_id)
+    
+    changed_fields = []
+    if completed_delta:
+        changed_fields += ['total_habits_completed', 'total_points', 'level']
+    if streak:
+        changed_fields.append('longest_streak')
+    check_achievements(user_id, user_stats, changed_fields)
+    return user_stats
+
+def expected_user_stats(user_id=None):
+    """Compute ``{user_id: (total_completed, longest_current_streak)}`` from the
+    persisted habit streaks in one grouped query"""
+    query = db.session.query(
+        Habit.user_id,
+        func.coalesce(func.sum(HabitStreak.current_streak), 0),
+        func.coalesce(func.max(HabitStreak.current_streak), 0)
+    ).join(HabitStreak, HabitStreak.habit_id == Habit.id).filter(
+        Habit.is_active == True
+    ).group_by(Habit.user_id)
+    if user_id is not None:
+        query = query.filter(Habit.user_id == user_id)
+    return {row[0]: (int(row[1]), int(row[2])) for row in query}
+
+def recompute_user_stats(user_id):
+    """Recompute a user's statistics from scratch and check for achievements"""
     user_stats = UserStats.query.filter_by(user_id=user_id).first()
     if not user_stats:
-        user_stats = UserStats(user_id=user_id)
+        user_stats = UserStats(user_id=user_id, longest_streak=0)
         db.session.add(user_stats)
     
-    # Calculate stats
-    habits = Habit.query.filter_by(user_id=user_id, is_active=True).all()
-    total_completed = sum(habit.streak for habit in habits)
-    longest_streak = max([habit.streak for habit in habits], default=0)
+    total_completed, longest_streak = expected_user_stats(user_id).get(user_id, (0, 0))
     
-    # Update stats
     user_stats.total_habits_completed = total_completed
-    user_stats.longest_streak = max(user_stats.longest_streak, longest_streak)
+    user_stats.longest_streak = max(user_stats.longest_streak or 0, longest_streak)
     user_stats.total_points = total_completed * 10  # 10 points per day
     user_stats.level = (user_stats.total_points // 100) + 1
     user_stats.last_updated = datetime.utcnow()
     
-    # Check for achievements
     check_achievements(user_id, user_stats)
-    
-    db.session.commit()
+    return user_stats
 
-def check_achievements(user_id, user_stats):
-    """Check and create new achievements for user"""
-    existing_achievements = [a.name for a in Achievement.query.filter_by(user_id=user_id).all()]
-    
-    # First habit achievement
-    if user_stats.total_habits_completed >= 1 and "First Steps" not in existing_achievements:
-        create_achievement(user_id, "First Steps", "Completed your first habit!", "fas fa-baby", "#10b981")
-    
-    # Week warrior
-    if user_stats.total_habits_completed >= 7 and "Week Warrior" not in existing_achievements:
-        create_achievement(user_id, "Week Warrior", "Completed habits for 7 days!", "fas fa-calendar-week", "#6366f1")
-    
-    # Month master
-    if user_stats.total_habits_completed >= 30 and "Month Master" not in existing_achievements:
-        create_achievement(user_id, "Month Master", "Completed habits for 30 days!", "fas fa-calendar-alt", "#8b5cf6")
-    
-    # Streak master
-    if user_stats.longest_streak >= 10 and "Streak Master" not in existing_achievements:
-        create_achievement(user_id, "Streak Master", f"Maintained a {user_stats.longest_streak}-day streak!", "fas fa-fire", "#f59e0b")
-    
-    # Level up achievements
-    if user_stats.level >= 5 and "Rising Star" not in existing_achievements:
-        create_achievement(user_id, "Rising Star", f"Reached level {user_stats.level}!", "fas fa-star", "#ec4899")
-    
-    if user_stats.level >= 10 and "Habit Hero" not in existing_achievements:
-        create_achievement(user_id, "Habit Hero", f"Reached level {user_stats.level}!", "fas fa-crown", "#f59e0b")
+def apply_goal_delta(habit_id, day, delta):
+    """Add ``delta`` completions on ``day`` to the habit's open goals in one UPDATE.
 
-def create_achievement(user_id, name, description, icon, color):
-    """Create a new achievement for user"""
-    achievement = Achievement(
-        user_id=user_id,
-        name=name,
-        description=description,
-        icon=icon,
-        color=color,
-        points=10
+    Only goals created on or before ``day`` count it. Returns the updated
+    goals; the caller commits.
+    """
+    new_value = HabitGoal.current_value + delta
+    stmt = update(HabitGoal).where(
+        HabitGoal.habit_id == habit_id,
+        HabitGoal.is_achieved == False,
+        HabitGoal.created_at < datetime.combine(day + timedelta(days=1), datetime.min.time())
+    ).values(
+        # Both expressions see the values from before the update
+        current_value=case(
+            (new_value >= HabitGoal.target_value, HabitGoal.target_value),
+            (new_value < 0, 0),
+            else_=new_value
+        ),
+        is_achieved=new_value >= HabitGoal.target_value
     )
-    db.session.add(achievement)
+    
+    if db.session.get_bind(mapper=HabitGoal).dialect.update_returning:
+        return db.session.execute(stmt.returning(HabitGoal)).scalars().all()
+    db.session.execute(stmt)
+    return HabitGoal.query.filter(
+        HabitGoal.habit_id == habit_id,
+        HabitGoal.created_at < datetime.combine(day + timedelta(days=1), datetime.min.time())
+    ).populate_existing().all()
 
-def update_habit_goals(habit_id):
-    """Update habit goals based on completion"""
-    habit = Habit.query.get(habit_id)
-    if not habit:
-        return
-    
-    # Get active goals for this habit
-    goals = HabitGoal.query.filter_by(habit_id=habit_id, is_achieved=False).all()
-    
-    for goal in goals:
-        # Count completed days since goal creation
-        completed_days = HabitLog.query.filter(
-            HabitLog.habit_id == habit_id,
-            HabitLog.completed == True,
-            HabitLog.date >= goal.created_at.date()
-        ).count()
-        
-        goal.current_value = completed_days
-        
-        # Check if goal is achieved
-        if goal.current_value >= goal.target_value:
-            goal.is_achieved = True
-            goal.current_value = goal.target_value  # Cap at target value
+def recompute_goals(user_id=None):
+    """Recompute the progress of every open goal, of one user or of everyone,
+    from the logs with one grouped query and one bulk UPDATE.
+
+    Returns how many goals changed; the caller commits.
+    """
+    completed = func.count(HabitLog.id)
+    query = db.session.query(
+        HabitGoal.id, HabitGoal.current_value, HabitGoal.target_value, completed
+    ).join(Habit, Habit.id == HabitGoal.habit_id).outerjoin(HabitLog, db.and_(
+        HabitLog.habit_id == HabitGoal.habit_id,
+        HabitLog.completed == True,
+        HabitLog.date >= func.date(HabitGoal.created_at)
+    )).filter(HabitGoal.is_achieved == False).group_by(HabitGoal.id)
+    if user_id is not None:
+        query = query.filter(Habit.user_id == user_id)
     
-    db.session.commit()
+    changes = []
+    for goal_id, current_value, target_value, count in query:
+        value = min(count, target_value)
+        if value != current_value:
+            changes.append({'id': goal_id, 'current_value': value, 'is_achieved': count >= target_value})
+    if changes:
+        db.session.execute(update(HabitGoal), changes)
+    return len(changes)
+
+def insight_to_dict(insight):
+    return {
+        'id': insight.id,
+        'type': insight.type,
+        'title': insight.title,
+        'message': insight.message,
+        'confidence': insight.confidence
+    }
 
 def create_initial_insights(user_id):
     """Create initial AI insights for new users"""
@@ -383,13 +644,14 @@ def create_initial_insights(user_id):
         )
         db.session.add(insight)
     
+    User.bump_data_version(user_id)
     db.session.commit()
 
 def generate_new_insight(user_id):
-    """Generate a new AI insight based on user's habit data"""
-    habits = Habit.query.filter_by(user_id=user_id).all()
+    """Generate a new AI insight from the user's completion matrix"""
+    matrix = analytics.load_matrix(user_id)
     
-    if not habits:
+    if matrix.empty:
         # Default insight if no habits exist
         insight = AIInsight(
             user_id=user_id,
@@ -403,16 +665,22 @@ def generate_new_insight(user_id):
         insight_types = ['motivation', 'improvement', 'trend', 'tip']
         selected_type = random.choice(insight_types)
         
+        # Confidence grows with the amount of recent history behind the numbers
+        tracked_days = int(matrix.tracked[:, -28:].sum(axis=1).max())
+        data_confidence = min(60 + tracked_days, 95)
+        
         if selected_type == 'motivation':
             # Find habit with highest streak
-            best_habit = max(habits, key=lambda h: h.streak)
-            if best_habit.streak > 0:
+            streaks = matrix.current_streaks()
+            best = int(streaks.argmax())
+            if streaks[best] > 0:
+                name, streak = matrix.names[best], int(streaks[best])
                 insight = AIInsight(
                     user_id=user_id,
                     type='motivation',
-                    title=f'Great Progress on {best_habit.name}!',
-                    message=f'You\'ve maintained a {best_habit.streak}-day streak on {best_habit.name}. This consistency is building strong neural pathways. Keep it up!',
-                    confidence=random.randint(85, 95)
+                    title=f'Great Progress on {name}!',
+                    message=f'You\'ve maintained a {streak}-day streak on {name}. This consistency is building strong neural pathways. Keep it up!',
+                    confidence=data_confidence
                 )
             else:
                 insight = AIInsight(
@@ -424,30 +692,46 @@ def generate_new_insight(user_id):
                 )
                 
         elif selected_type == 'improvement':
-            # Find habit with lowest completion rate
-            worst_habit = min(habits, key=lambda h: h.completion_rate)
-            day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            random_day = random.choice(day_names)
+            # Find habit with lowest completion rate and its weakest weekday
+            _, worst = matrix.best_and_worst(days=30)
+            weekdays = matrix.weak_and_strong_weekday(worst)
+            if weekdays:
+                weak_day, strong_day = weekdays
+                message = f'Your {matrix.names[worst]} completion rate is lower than other habits, especially on {weak_day}s. Consider scheduling it on {strong_day}s when you tend to follow through more often.'
+            else:
+                message = f'Your {matrix.names[worst]} completion rate is lower than other habits. Try tying it to something you already do every day, like your morning coffee.'
             
             insight = AIInsight(
                 user_id=user_id,
                 type='improvement',
                 title='Optimization Suggestion',
-                message=f'Your {worst_habit.name} completion rate is lower than other habits. Consider scheduling it on {random_day}s when you might have more energy or time.',
-                confidence=random.randint(80, 90)
+                message=message,
+                confidence=data_confidence
             )
             
         elif selected_type == 'trend':
-            # Random positive trend insight
-            random_habit = random.choice(habits)
-            improvement = random.randint(10, 30)
+            # Habit whose completion rate changed most over the last two weeks
+            change = matrix.period_change(days=14)
+            index = int(abs(change).argmax())
+            points = int(round(change[index] * 100))
+            name = matrix.names[index]
+            
+            if points > 0:
+                title = 'Positive Trend Detected'
+                message = f'Your {name} completion rate is up {points} percentage points compared to the previous two weeks. Great progress!'
+            elif points < 0:
+                title = 'Trend Worth Watching'
+                message = f'Your {name} completion rate is down {-points} percentage points compared to the previous two weeks. A small, easy win today can turn it around.'
+            else:
+                title = 'Steady Progress'
+                message = f'Your {name} completion rate has held steady over the last four weeks. Consistency is what turns actions into habits.'
             
             insight = AIInsight(
                 user_id=user_id,
                 type='trend',
-                title='Positive Trend Detected',
-                message=f'Your {random_habit.name} habit shows {improvement}% improvement over the last two weeks. Great progress!',
-                confidence=random.randint(85, 95)
+                title=title,
+                message=message,
+                confidence=data_confidence
             )
             
         else:  # tip
@@ -468,6 +752,7 @@ def generate_new_insight(user_id):
             )
     
     db.session.add(insight)
+    User.bump_data_version(user_id)
     db.session.commit()
     
     return insight
\ No newline at end of file
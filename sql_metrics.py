@@ -0,0 +1,194 @@
+"""Per-request SQL instrumentation.
+
+Engine events time every statement run while handling a request. When the
+request ends (after a streamed body such as ``/api/export`` has been sent)
+its query count, database time and slowest statement are added to
+per-endpoint totals, which ``/metrics`` exports. A statement shape (the SQL
+with literals and IN-list lengths normalized) that runs
+``SQL_N_PLUS_ONE_THRESHOLD`` or more times in one request is flagged as an
+N+1 suspect, together with the application line that issued it (for example
+the ``Habit`` property being read in a loop). With ``SQL_REQUEST_LOG`` on,
+each request also logs one JSON line.
+"""
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+from metrics import collector, format_labels
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+MAX_SUSPECTS_PER_ENDPOINT = 20
+
+_SHAPE_SUBSTITUTIONS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),  # string literals
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),  # numbers
+    (re.compile(r'\(\s*(?:\?\s*,\s*)+\?\s*\)'), '(?...)'),  # IN lists of any length
+    (re.compile(r'\s+'), ' '),
+]
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+def statement_shape(statement):
+    """Normalize a statement so repeats with different parameters compare equal"""
+    for pattern, replacement in _SHAPE_SUBSTITUTIONS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def _app_frame():
+    """``file:line in function`` of the innermost application frame on the stack"""
+    root = current_app.root_path + os.sep
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and filename != __file__ and os.sep + 'site-packages' + os.sep not in filename:
+            return f'{os.path.relpath(filename, root)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _new_stats():
+    return {'count': 0, 'seconds': 0.0, 'slowest': (0.0, ''), 'shapes': Counter(), 'origins': {}}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts or not has_request_context():
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = g.get('_sql_stats')
+    if stats is None:
+        stats = g._sql_stats = _new_stats()
+    stats['count'] += 1
+    stats['seconds'] += elapsed
+    if elapsed > stats['slowest'][0]:
+        stats['slowest'] = (elapsed, statement)
+    shape = statement_shape(statement)
+    stats['shapes'][shape] += 1
+    # Walking the stack is only worth it once a shape becomes a suspect
+    if stats['shapes'][shape] == current_app.config['SQL_N_PLUS_ONE_THRESHOLD']:
+        stats['origins'][shape] = _app_frame()
+
+
+def _record(endpoint, stats, suspects):
+    with _lock:
+        totals = _endpoints.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'seconds': 0.0, 'buckets': [0] * len(QUERY_BUCKETS),
+            'slowest': (0.0, ''), 'n_plus_one_requests': 0, 'suspects': Counter()
+        })
+        totals['requests'] += 1
+        totals['queries'] += stats['count']
+        totals['seconds'] += stats['seconds']
+        for index, bound in enumerate(QUERY_BUCKETS):
+            if stats['count'] <= bound:
+                totals['buckets'][index] += 1
+        if stats['slowest'][0] > totals['slowest'][0]:
+            totals['slowest'] = stats['slowest']
+        if suspects:
+            totals['n_plus_one_requests'] += 1
+            for suspect in suspects:
+                if suspect in totals['suspects'] or len(totals['suspects']) < MAX_SUSPECTS_PER_ENDPOINT:
+                    totals['suspects'][suspect] += 1
+
+
+def endpoint_stats():
+    """Copy of the per-endpoint totals"""
+    with _lock:
+        return {endpoint: dict(totals, buckets=list(totals['buckets']), suspects=Counter(totals['suspects']))
+                for endpoint, totals in _endpoints.items()}
+
+
+@collector
+def sql_metrics():
+    lines = [
+        '# HELP http_db_requests_total Requests handled, per endpoint.',
+        '# TYPE http_db_requests_total counter',
+        '# HELP http_db_queries_per_request SQL statements run per request.',
+        '# TYPE http_db_queries_per_request histogram',
+        '# HELP http_db_query_seconds_total Time spent executing SQL, per endpoint.',
+        '# TYPE http_db_query_seconds_total counter',
+        '# HELP http_db_slowest_query_seconds Slowest statement seen, per endpoint.',
+        '# TYPE http_db_slowest_query_seconds gauge',
+        '# HELP http_db_n_plus_one_requests_total Requests that repeated a statement shape.',
+        '# TYPE http_db_n_plus_one_requests_total counter',
+        '# HELP http_db_n_plus_one_suspect_total Requests repeating this statement shape.',
+        '# TYPE http_db_n_plus_one_suspect_total counter',
+    ]
+    for endpoint, totals in sorted(endpoint_stats().items()):
+        labels = {'endpoint': endpoint}
+        lines.append(f'http_db_requests_total{format_labels(**labels)} {totals["requests"]}')
+        for bound, count in zip(QUERY_BUCKETS, totals['buckets']):
+            lines.append(f'http_db_queries_per_request_bucket{format_labels(**labels, le=bound)} {count}')
+        lines += [
+            f'http_db_queries_per_request_bucket{format_labels(**labels, le="+Inf")} {totals["requests"]}',
+            f'http_db_queries_per_request_sum{format_labels(**labels)} {totals["queries"]}',
+            f'http_db_queries_per_request_count{format_labels(**labels)} {totals["requests"]}',
+            f'http_db_query_seconds_total{format_labels(**labels)} {totals["seconds"]:.6f}',
+            f'http_db_slowest_query_seconds{format_labels(**labels, statement=statement_shape(totals["slowest"][1])[:200])} '
+            f'{totals["slowest"][0]:.6f}',
+            f'http_db_n_plus_one_requests_total{format_labels(**labels)} {totals["n_plus_one_requests"]}',
+        ]
+        for (shape, origin), count in totals['suspects'].most_common():
+            lines.append(f'http_db_n_plus_one_suspect_total{format_labels(**labels, statement=shape[:200], origin=origin)} {count}')
+    return lines
+
+
+def register_sql_metrics(app):
+    """Instrument every engine and aggregate per request"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def finish(endpoint, method, status, stats):
+        if not stats['count']:
+            return
+        threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        suspects = [(shape, stats['origins'].get(shape, 'unknown')) for shape, count in stats['shapes'].items()
+                    if count >= threshold and shape.upper().startswith('SELECT')]
+        _record(endpoint, stats, suspects)
+
+        if app.config.get('SQL_REQUEST_LOG'):
+            app.logger.info(json.dumps({
+                'event': 'sql_request',
+                'endpoint': endpoint,
+                'method': method,
+                'status': status,
+                'queries': stats['count'],
+                'db_ms': round(stats['seconds'] * 1000, 2),
+                'slowest_ms': round(stats['slowest'][0] * 1000, 2),
+                'slowest': statement_shape(stats['slowest'][1])[:500],
+                'n_plus_one': [
+                    {'statement': shape[:500], 'count': stats['shapes'][shape], 'origin': origin}
+                    for shape, origin in suspects
+                ],
+            }))
+
+    @app.after_request
+    def record_sql_stats(response):
+        if request.endpoint is None:
+            return response
+        stats = g.get('_sql_stats')
+        if stats is None:
+            stats = g._sql_stats = _new_stats()
+        if app.debug:
+            response.headers['X-DB-Queries'] = f"count={stats['count']}; time={stats['seconds'] * 1000:.1f}ms"
+        # A streamed body (stream_with_context) keeps adding to ``stats`` until
+        # the server closes the response, so the request is recorded then
+        response.call_on_close(functools.partial(
+            finish, request.endpoint, request.method, response.status_code, stats
+        ))
+        return response
@@ -0,0 +1,59 @@
+"""SQLite connection tuning shared by the Flask app and the Streamlit app.
+
+Every new SQLite connection gets the pragmas below. WAL lets readers run
+alongside the single writer, ``busy_timeout`` makes a blocked writer wait for
+the lock instead of failing with "database is locked", and ``synchronous=NORMAL``
+is durable across application crashes in WAL mode (only an OS crash can lose
+the most recent commits). Each setting can be overridden from the environment;
+``SQLITE_TUNING=off`` disables the profile.
+"""
+import os
+import sqlite3
+
+# (pragma, environment variable, default)
+PRAGMAS = [
+    ('journal_mode', 'SQLITE_JOURNAL_MODE', 'WAL'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS', 'NORMAL'),
+    ('busy_timeout', 'SQLITE_BUSY_TIMEOUT', '5000'),  # milliseconds
+    ('mmap_size', 'SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),  # bytes
+    ('cache_size', 'SQLITE_CACHE_SIZE', '-20000'),  # negative: KiB per connection
+    ('temp_store', 'SQLITE_TEMP_STORE', 'MEMORY'),
+]
+
+
+def pragmas_from_env(environ=None):
+    """Return the configured ``[(pragma, value)]``, empty when tuning is off"""
+    environ = os.environ if environ is None else environ
+    if environ.get('SQLITE_TUNING', 'on').lower() in ('off', 'false', '0'):
+        return []
+    return [(name, environ.get(variable, default)) for name, variable, default in PRAGMAS]
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run ``PRAGMA name=value`` for each setting on a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def register(app):
+    """Apply ``app.config['SQLITE_PRAGMAS']`` to every SQLite connection the app opens"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    pragmas = app.config.get('SQLITE_PRAGMAS') or []
+
+    # Listening on the Engine class covers the main database and every bind
+    @event.listens_for(Engine, 'connect')
+    def tune_sqlite(dbapi_connection, connection_record):
+        if pragmas and isinstance(dbapi_connection, sqlite3.Connection):
+            apply_pragmas(dbapi_connection, pragmas)
+
+
+def connect(path, pragmas=None, **kwargs):
+    """``sqlite3.connect`` with the tuning profile applied"""
+    connection = sqlite3.connect(path, **kwargs)
+    apply_pragmas(connection, pragmas_from_env() if pragmas is None else pragmas)
+    return connection
@@ -191,6 +191,27 @@ function setupNavbarScroll() {
     }
 }
 
+/**
+ * Poll a background job until it finishes and resolve with its final state
+ */
+function waitForJob(statusUrl, interval = 500) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'done' || job.status === 'failed') {
+                        resolve(job);
+                    } else {
+                        setTimeout(poll, interval);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
 /**
  * Progress bar animation
  */
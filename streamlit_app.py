@@ -6,6 +6,7 @@ A modern, interactive habit tracking application for Streamlit Cloud
 
 import streamlit as st
 import sqlite3
+import sqlite_tuning
 import hashlib
 import datetime
 import random
@@ -76,7 +77,7 @@ st.markdown("""
 # Database functions
 def init_database():
     """Initialize the SQLite database"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     # Create tables
@@ -152,7 +153,7 @@ def hash_password(password):
 
 def authenticate_user(username, password):
     """Authenticate user login"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     password_hash = hash_password(password)
@@ -165,7 +166,7 @@ def authenticate_user(username, password):
 
 def register_user(username, email, password):
     """Register a new user"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     try:
@@ -196,7 +197,7 @@ def register_user(username, email, password):
 
 def get_user_habits(user_id):
     """Get all habits for a user"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     cursor.execute('SELECT * FROM habits WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
@@ -207,7 +208,7 @@ def get_user_habits(user_id):
 
 def get_habit_logs(habit_id, days=30):
     """Get habit logs for the last N days"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     start_date = datetime.now().date() - timedelta(days=days)
@@ -223,7 +224,7 @@ def get_habit_logs(habit_id, days=30):
 
 def toggle_habit(habit_id, date):
     """Toggle habit completion for a specific date"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     # Check if log exists
@@ -245,7 +246,7 @@ def toggle_habit(habit_id, date):
 
 def add_habit(user_id, name, description, category, color, icon, frequency):
     """Add a new habit"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -258,7 +259,7 @@ def add_habit(user_id, name, description, category, color, icon, frequency):
 
 def get_user_stats(user_id):
     """Get user statistics"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     cursor.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,))
@@ -269,7 +270,7 @@ def get_user_stats(user_id):
 
 def get_user_achievements(user_id):
     """Get user achievements"""
-    conn = sqlite3.connect('habits.db')
+    conn = sqlite_tuning.connect('habits.db')
     cursor = conn.cursor()
     
     cursor.execute('SELECT * FROM achievements WHERE user_id = ? ORDER BY unlocked_at DESC', (user_id,))
@@ -0,0 +1,54 @@
+"""Reads of a replica-enabled request after it wrote to the primary."""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+DIRECTORY = tempfile.mkdtemp(prefix='habit-replica-test-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(DIRECTORY, 'primary.db')}",
+    DATABASE_REPLICA_URL=f"sqlite:///{os.path.join(DIRECTORY, 'replica.db')}",
+    JOB_QUEUE_URL=f"sqlite:///{os.path.join(DIRECTORY, 'jobs.db')}",
+    JOB_BACKEND='worker',
+    SNAPSHOT_CACHE_URL='off',
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db  # noqa: E402
+from models import User, UserStats  # noqa: E402
+
+
+def teardown_module():
+    shutil.rmtree(DIRECTORY, ignore_errors=True)
+
+
+def sync_replica():
+    source = sqlite3.connect(os.path.join(DIRECTORY, 'primary.db'))
+    target = sqlite3.connect(os.path.join(DIRECTORY, 'replica.db'))
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def test_new_user_dashboard_with_lagging_replica():
+    with app.app_context():
+        db.create_all()
+        user = User(username='lagging', email='lagging@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    # The replica has the user but none of the rows the first dashboard load creates
+    sync_replica()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+
+    with app.app_context():
+        assert UserStats.query.filter_by(user_id=user_id).count() == 1
@@ -0,0 +1,223 @@
+"""Nightly batch training of trend insights for every user.
+
+Users are processed in chunks. For each chunk the parent process loads the
+active habits' history bits in one query, the per-habit completion series are
+stacked into a matrix and fitted with a single multi-output
+``LinearRegression`` per series length, and the resulting ``AIInsight`` rows
+are bulk-inserted. With ``workers > 1`` the fitting runs in a process pool;
+workers only ever see plain Python data and the parent does all database I/O.
+"""
+from app import db
+from models import User, Habit, AIInsight
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+import history
+
+WINDOW_DAYS = 28
+MIN_DAYS = 7
+FORECAST_DAYS = 7
+TREND_THRESHOLD = 0.05  # change in weekly completion rate worth mentioning
+
+
+def load_chunk(after_user_id, chunk_size):
+    """Return ``(user_ids, records)`` for the next ``chunk_size`` users with active habits.
+
+    Records are ``(user_id, habit_id, name, bits, start, tracked_since)``
+    tuples, cheap to pickle for the process pool.
+    """
+    user_ids = [row[0] for row in db.session.query(Habit.user_id).filter(
+        Habit.is_active == True,
+        Habit.user_id > after_user_id
+    ).distinct().order_by(Habit.user_id).limit(chunk_size)]
+    if not user_ids:
+        return [], []
+    habits = db.session.query(
+        Habit.user_id, Habit.id, Habit.name, Habit.history_bits, Habit.history_start, Habit.created_at
+    ).filter(
+        Habit.is_active == True,
+        Habit.history_bits.isnot(None),
+        Habit.user_id.in_(user_ids)
+    ).order_by(Habit.user_id, Habit.id)
+    records = []
+    for user_id, habit_id, name, bits, start, created_at in habits:
+        created = (created_at or datetime.utcnow()).date()
+        tracked_since = min(created, start) if start else created
+        records.append((user_id, habit_id, name, bits, start, tracked_since))
+    return user_ids, records
+
+
+def completion_matrix(records, today, window=WINDOW_DAYS):
+    """Stack the last ``window`` days of each record's history into a habits x days matrix.
+
+    Returns ``(matrix, lengths)`` where ``lengths[i]`` is how many of the
+    trailing days habit ``i`` has been tracked for.
+    """
+    import numpy as np
+    first = today - timedelta(days=window - 1)
+    matrix = np.zeros((len(records), window), dtype=np.float64)
+    lengths = np.zeros(len(records), dtype=np.int64)
+    for i, (_, _, _, bits, start, tracked_since) in enumerate(records):
+        lengths[i] = min(max((today - tracked_since).days + 1, 0), window)
+        if not start or not bits:
+            continue
+        days = history.unpack(bits)
+        offset = (first - start).days
+        lo, hi = max(offset, 0), min(offset + window, days.size)
+        if lo < hi:
+            matrix[i, lo - offset:hi - offset] = days[lo:hi]
+    return matrix, lengths
+
+
+def fit_trends(matrix, lengths, horizon=FORECAST_DAYS):
+    """Fit a completion trend for every row of ``matrix``.
+
+    Habits tracked for the same number of days share one multi-output
+    regression over those days. Returns per-habit arrays ``(slope, forecast,
+    confidence)``: slope in completion-rate change per day, forecast as the
+    expected completion rate over the next ``horizon`` days, and confidence as
+    0-100 from the standard error of that forecast. Habits with fewer than
+    ``MIN_DAYS`` tracked days get a NaN forecast.
+    """
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+
+    count = matrix.shape[0]
+    slope = np.zeros(count)
+    forecast = np.full(count, np.nan)
+    confidence = np.zeros(count, dtype=np.int64)
+
+    for length in np.unique(lengths[lengths >= MIN_DAYS]):
+        rows = np.flatnonzero(lengths == length)
+        x = np.arange(length, dtype=np.float64)[:, None]
+        y = matrix[rows, -length:].T  # days x habits
+        model = LinearRegression().fit(x, y)
+
+        future = np.arange(length, length + horizon, dtype=np.float64)[:, None]
+        predicted = np.clip(model.predict(future).mean(axis=0), 0, 1)
+
+        # Standard error of the mean prediction over the forecast horizon
+        residuals = y - model.predict(x)
+        sigma = np.sqrt((residuals ** 2).sum(axis=0) / max(length - 2, 1))
+        x_mean = (length - 1) / 2
+        sxx = ((x[:, 0] - x_mean) ** 2).sum()
+        leverage = 1 / length + (future[:, 0].mean() - x_mean) ** 2 / sxx
+        standard_error = sigma * np.sqrt(leverage)
+
+        slope[rows] = model.coef_[:, 0]
+        forecast[rows] = predicted
+        confidence[rows] = np.clip(np.rint(100 * (1 - standard_error)), 0, 99)
+
+    return slope, forecast, confidence
+
+
+def build_insights(records, today, window=WINDOW_DAYS):
+    """Return AIInsight row dicts, one per user, for the habit with the strongest trend.
+
+    Pure function of ``records`` so it can run in a worker process.
+    """
+    import numpy as np
+    if not records:
+        return []
+    matrix, lengths = completion_matrix(records, today, window)
+    slope, forecast, confidence = fit_trends(matrix, lengths)
+
+    user_ids = np.array([record[0] for record in records])
+    weekly_change = slope * 7
+    strength = np.where(np.isnan(forecast), -1, np.abs(weekly_change))
+    created_at = datetime.utcnow()
+
+    rows = []
+    # Records are sorted by user, so each user's habits form one contiguous block
+    boundaries = np.flatnonzero(np.diff(user_ids)) + 1
+    for block in np.split(np.arange(len(records)), boundaries):
+        best = block[strength[block].argmax()]
+        if np.isnan(forecast[best]):
+            continue
+        name = records[best][2]
+        days = int(round(forecast[best] * FORECAST_DAYS))
+        points = int(round(abs(weekly_change[best]) * 100))
+        if weekly_change[best] >= TREND_THRESHOLD:
+            title = f'{name} Is Trending Up'
+            message = (f'Your {name} completion rate is climbing about {points} percentage points a week. '
+                       f'At this pace you should complete it on {days} of the next {FORECAST_DAYS} days.')
+        elif weekly_change[best] <= -TREND_THRESHOLD:
+            title = f'{name} Is Slipping'
+            message = (f'Your {name} completion rate is dropping about {points} percentage points a week, '
+                       f'putting you on track for {days} of the next {FORECAST_DAYS} days. '
+                       f'Tying it to a fixed time of day can turn this around.')
+        else:
+            title = f'Steady Pace on {name}'
+            message = (f'Your {name} completion has been steady over the last {int(lengths[best])} days. '
+                       f'Expect to complete it on about {days} of the next {FORECAST_DAYS} days.')
+        rows.append({
+            'user_id': int(user_ids[best]),
+            'type': 'trend',
+            'title': title[:100],
+            'message': message,
+            'confidence': int(confidence[best]),
+            'created_at': created_at
+        })
+    return rows
+
+
+def train_insights(chunk_size=1000, workers=1, today=None, user_id=None, progress=None):
+    """Generate trend insights for every user with active habits.
+
+    Returns ``(users, insights)`` processed. ``progress`` is called with the
+    running totals after each chunk is written.
+    """
+    today = today or datetime.utcnow().date()
+    users = insights = 0
+
+    def write(rows):
+        nonlocal insights
+        if rows:
+            db.session.execute(insert(AIInsight), rows)
+            User.bump_data_version(*{row['user_id'] for row in rows})
+            db.session.commit()
+        insights += len(rows)
+
+    def chunks():
+        nonlocal users
+        if user_id is not None:
+            user_ids, records = load_chunk(user_id - 1, 1)
+            user_ids = [uid for uid in user_ids if uid == user_id]
+            records = [record for record in records if record[0] == user_id]
+            users += len(user_ids)
+            yield records
+            return
+        last = 0
+        while True:
+            user_ids, records = load_chunk(last, chunk_size)
+            if not user_ids:
+                return
+            last = user_ids[-1]
+            users += len(user_ids)
+            # The reads are done; don't hold the transaction open while fitting
+            db.session.rollback()
+            yield records
+
+    if workers <= 1:
+        for records in chunks():
+            write(build_insights(records, today))
+            if progress:
+                progress(users, insights)
+        return users, insights
+
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for records in chunks():
+            pending.add(pool.submit(build_insights, records, today))
+            # Keep at most two chunks per worker in flight to bound memory
+            while len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+                if progress:
+                    progress(users, insights)
+        for future in pending:
+            write(future.result())
+    if progress:
+        progress(users, insights)
+    return users, insights